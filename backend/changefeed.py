@@ -0,0 +1,148 @@
+"""
+Per-user change feed for items and boards, streamed as Server-Sent Events.
+routes/items.py publishes one event per successful mutation; every open connection of that
+user gets it. Each connection has a bounded queue: a consumer that falls behind has its
+backlog dropped and receives a single `resync` event, telling it to refetch in full.
+
+With a store other processes share (ITEMS_BACKEND=sqlite), publish() appends to the store's
+change log instead, and every worker tails that log and delivers to its own connections, so
+a client on one worker sees mutations made on another. Otherwise delivery is in-process.
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+import orjson
+
+from storage import ItemStore
+
+logger = logging.getLogger(__name__)
+
+_RESYNC = "event: resync\ndata: {}\n\n"
+_CLOSE = ""  # empty frame queued by close(): end of stream
+
+
+class _Subscription:
+    __slots__ = ("queue",)
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+
+
+class ChangeFeed:
+    def __init__(
+        self,
+        queue_size: int = 256,
+        ping_interval: float = 15.0,
+        poll_interval: float = 0.25,
+        retention: float = 300.0,
+    ):
+        self.queue_size = queue_size
+        self.ping_interval = ping_interval
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._subs: dict[str, set[_Subscription]] = {}
+        self._seq = 0
+        self._log: Optional[ItemStore] = None
+        self._tail: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    async def start(self, store: ItemStore) -> None:
+        """Route events through the store's change log when other workers share the store."""
+        if not store.shared_changes or self._tail is not None:
+            return
+        self._log = store
+        self._seq = await store.last_change()
+        self._tail = asyncio.create_task(self._tail_log())
+
+    async def _tail_log(self) -> None:
+        pruned_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await self._log.changes_after(self._seq, 1000)
+                for seq, user_id, event, data in rows:
+                    self._seq = seq
+                    self._deliver(user_id, f"id: {seq}\nevent: {event}\ndata: {data}\n\n")
+                if time.monotonic() - pruned_at > self.retention:
+                    pruned_at = time.monotonic()
+                    await self._log.prune_changes(time.time() - self.retention)
+            except Exception as e:  # keep tailing; the next poll picks up where this one stopped
+                logger.warning("change log poll failed: %r", e)
+
+    async def publish(self, user_id: str | None, event: str, **data) -> None:
+        """Send an event to every connection of user_id, on any worker sharing the store."""
+        if self._log is not None:
+            self.published += 1
+            try:
+                await self._log.append_change(user_id or "", event, orjson.dumps(data).decode())
+            except Exception as e:  # the mutation itself succeeded; don't fail the request
+                logger.warning("change log append failed: %r", e)
+            return
+        if not self._subs.get(user_id or ""):
+            return
+        self._seq += 1
+        self.published += 1
+        # encoded once, shared by every connection
+        self._deliver(user_id or "", f"id: {self._seq}\nevent: {event}\ndata: {orjson.dumps(data).decode()}\n\n")
+
+    def _deliver(self, user_key: str, frame: str) -> None:
+        """Queue a frame for every connection of the user; never blocks the caller."""
+        for sub in self._subs.get(user_key, ()):
+            try:
+                sub.queue.put_nowait(frame)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.overflows += 1
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(_RESYNC)
+
+    def close(self) -> None:
+        """End every open stream (server shutdown); clients reconnect elsewhere and resync."""
+        if self._tail is not None:
+            self._tail.cancel()
+            self._tail = None
+        self._log = None
+        for subs in self._subs.values():
+            for sub in subs:
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(_CLOSE)
+
+    async def stream(self, user_id: str | None) -> AsyncIterator[str]:
+        """SSE frames for one connection, with comment pings so idle proxies keep it open."""
+        key = user_id or ""
+        sub = _Subscription(self.queue_size)
+        self._subs.setdefault(key, set()).add(sub)
+        try:
+            yield "event: ready\ndata: {}\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), self.ping_interval)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if not frame:
+                    return
+                yield frame
+        finally:
+            subs = self._subs.get(key)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[key]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subs),
+            "connections": sum(len(s) for s in self._subs.values()),
+            "queue_size": self.queue_size,
+            "shared": self._log is not None,
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
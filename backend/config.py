@@ -4,6 +4,100 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DEDALUS_API_KEY = os.getenv("DEDALUS_API_KEY", "")
+# Override to point at a local stand-in (see loadtest/fake_dedalus.py)
+DEDALUS_API_URL = os.getenv("DEDALUS_API_URL", "https://api.dedaluslabs.ai/v1/chat/completions")
 REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "1").strip().lower() in ("1", "true", "yes")
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
+
+# Shared upstream HTTP pool (see upstream.py)
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1").strip().lower() in ("1", "true", "yes")
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10"))
+# Connections to open to the Dedalus host at startup, before serving (serve.py --prewarm)
+UPSTREAM_PREWARM = int(os.getenv("UPSTREAM_PREWARM", "0"))
+
+# Perceptual-hash result cache for /analyze (see phash_cache.py)
+ANALYZE_CACHE_SIZE = int(os.getenv("ANALYZE_CACHE_SIZE", "1024"))
+ANALYZE_CACHE_TTL = float(os.getenv("ANALYZE_CACHE_TTL", "3600"))
+ANALYZE_CACHE_MAX_DISTANCE = int(os.getenv("ANALYZE_CACHE_MAX_DISTANCE", "4"))
+
+# Label-keyed product suggestion cache (see label_cache.py)
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "4096"))
+
+# POST /analyze/batch
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "4"))
+ANALYZE_BATCH_MAX_ITEMS = int(os.getenv("ANALYZE_BATCH_MAX_ITEMS", "50"))
+
+# Crop normalization before vision calls (see imaging.py)
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "768"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "JPEG").strip().upper()  # JPEG | WEBP
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Thumbnails of images saved inline in item metadata (see thumbnails.py): longest side in px
+THUMBNAIL_SIZES = sorted({int(s) for s in os.getenv("THUMBNAIL_SIZES", "160,480").split(",") if s.strip()})
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "WEBP").strip().upper()  # WEBP | JPEG
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Binary uploads (POST /analyze/upload)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Default /analyze mode: "two_step" (label, then products) or "combined" (one multimodal call)
+ANALYZE_MODE = os.getenv("ANALYZE_MODE", "two_step").strip().lower()
+
+# Upstream guard: adaptive concurrency, circuit breaker, Retry-After backoff (see guard.py)
+GUARD_INITIAL_LIMIT = int(os.getenv("GUARD_INITIAL_LIMIT", "16"))
+GUARD_MIN_LIMIT = int(os.getenv("GUARD_MIN_LIMIT", "1"))
+GUARD_MAX_LIMIT = int(os.getenv("GUARD_MAX_LIMIT", "64"))
+GUARD_LATENCY_TARGET = float(os.getenv("GUARD_LATENCY_TARGET", "10"))
+GUARD_QUEUE_TIMEOUT = float(os.getenv("GUARD_QUEUE_TIMEOUT", "5"))
+GUARD_FAILURE_THRESHOLD = int(os.getenv("GUARD_FAILURE_THRESHOLD", "5"))
+GUARD_RESET_TIMEOUT = float(os.getenv("GUARD_RESET_TIMEOUT", "30"))
+GUARD_MAX_RETRIES = int(os.getenv("GUARD_MAX_RETRIES", "2"))
+GUARD_MAX_BACKOFF = float(os.getenv("GUARD_MAX_BACKOFF", "5"))
+
+# End-to-end /analyze deadline (seconds): callers may lower it with X-Request-Timeout
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "25"))
+# Skip the products step (return the description alone) below this remaining budget
+PRODUCTS_MIN_BUDGET = float(os.getenv("PRODUCTS_MIN_BUDGET", "1.0"))
+
+# Item/board storage backend: "memory" (single process) or "sqlite" (durable, shared by workers)
+ITEMS_BACKEND = os.getenv("ITEMS_BACKEND", "memory").strip().lower()
+ITEMS_DB_PATH = os.getenv("ITEMS_DB_PATH", "items.db")
+ITEMS_DB_THREADS = int(os.getenv("ITEMS_DB_THREADS", "4"))
+
+# GET /items page size when limit is omitted, and the largest page accepted by ?limit=
+ITEMS_DEFAULT_PAGE = int(os.getenv("ITEMS_DEFAULT_PAGE", "50"))
+ITEMS_MAX_PAGE = int(os.getenv("ITEMS_MAX_PAGE", "500"))
+
+# POST /items/bulk
+ITEMS_BULK_MAX_OPS = int(os.getenv("ITEMS_BULK_MAX_OPS", "1000"))
+
+# Idempotency-Key replay window for POST /items, kept in the item store (seconds / max keys
+# the memory backend remembers)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+
+# GET /items/events change feed: per-connection queue bound and keepalive ping (seconds)
+CHANGEFEED_QUEUE_SIZE = int(os.getenv("CHANGEFEED_QUEUE_SIZE", "256"))
+CHANGEFEED_PING_INTERVAL = float(os.getenv("CHANGEFEED_PING_INTERVAL", "15"))
+# With ITEMS_BACKEND=sqlite events go through a change log in the items database that every
+# worker polls (seconds between polls / seconds a logged event is kept)
+CHANGEFEED_POLL_INTERVAL = float(os.getenv("CHANGEFEED_POLL_INTERVAL", "0.25"))
+CHANGEFEED_RETENTION = float(os.getenv("CHANGEFEED_RETENTION", "300"))
+
+# /analyze admission control (see ratelimit.py): token bucket per user and endpoint
+# (ANALYZE_RATE tokens/second, 0 disables) and a daily per-user image quota (0 disables)
+ANALYZE_RATE = float(os.getenv("ANALYZE_RATE", "0.5"))
+ANALYZE_BURST = float(os.getenv("ANALYZE_BURST", "10"))
+ANALYZE_DAILY_QUOTA = int(os.getenv("ANALYZE_DAILY_QUOTA", "1000"))
+# "memory" (per process) or "sqlite" (shared by the workers on one host)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.db")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
@@ -0,0 +1,62 @@
+"""
+Request-level deadline propagated to every upstream call via a context variable.
+Each call gets the remaining budget as its timeout instead of a fixed per-call timeout.
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def start(budget: float) -> float:
+    """Set the deadline for the current request context; returns the budget in seconds."""
+    _deadline.set(time.monotonic() + budget)
+    return budget
+
+
+def start_from_header(value: Optional[str], cap: float) -> float:
+    """Budget from a caller header in seconds, capped by server config; invalid values use the cap."""
+    try:
+        budget = float(value) if value else cap
+    except ValueError:
+        budget = cap
+    if budget <= 0:
+        budget = cap
+    return start(min(budget, cap))
+
+
+def remaining() -> Optional[float]:
+    """Seconds left, or None when no deadline is set (e.g. scripts)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def timeout(default: float) -> float:
+    """Timeout for the next upstream call: min(default, remaining); raises if nothing is left."""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(default, left)
+
+
+async def bounded(aw, default: float):
+    """Await aw within timeout(default); asyncio timeouts become DeadlineExceeded."""
+    try:
+        budget = timeout(default)
+    except DeadlineExceeded:
+        aw.close()
+        raise
+    try:
+        return await asyncio.wait_for(aw, budget)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded")
@@ -0,0 +1,258 @@
+"""
+Upstream guard for Dedalus calls:
+- AIMD concurrency limit (additive increase on fast successes, multiplicative decrease on
+  429/5xx/timeouts or slow responses); callers over the limit queue briefly, then get rejected
+- circuit breaker (closed -> open after consecutive failures -> half-open probe -> closed)
+- Retry-After-aware retries with jittered exponential backoff on 429/503
+"""
+import asyncio
+import email.utils
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+import deadline
+from config import (
+    GUARD_FAILURE_THRESHOLD,
+    GUARD_INITIAL_LIMIT,
+    GUARD_LATENCY_TARGET,
+    GUARD_MAX_BACKOFF,
+    GUARD_MAX_LIMIT,
+    GUARD_MAX_RETRIES,
+    GUARD_MIN_LIMIT,
+    GUARD_QUEUE_TIMEOUT,
+    GUARD_RESET_TIMEOUT,
+    UPSTREAM_TIMEOUT,
+)
+
+RETRYABLE_STATUS = (429, 503)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling upstream: breaker open or concurrency queue timed out."""
+
+    def __init__(self, detail: str, retry_after: float = 1.0):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as delta-seconds or HTTP-date -> seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _is_failure(status: int) -> bool:
+    return status in RETRYABLE_STATUS or status >= 500
+
+
+class UpstreamGuard:
+    def __init__(
+        self,
+        initial_limit: int = GUARD_INITIAL_LIMIT,
+        min_limit: int = GUARD_MIN_LIMIT,
+        max_limit: int = GUARD_MAX_LIMIT,
+        latency_target: float = GUARD_LATENCY_TARGET,
+        queue_timeout: float = GUARD_QUEUE_TIMEOUT,
+        failure_threshold: int = GUARD_FAILURE_THRESHOLD,
+        reset_timeout: float = GUARD_RESET_TIMEOUT,
+        max_retries: int = GUARD_MAX_RETRIES,
+        max_backoff: float = GUARD_MAX_BACKOFF,
+        half_open_probes: int = 1,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.half_open_probes = half_open_probes
+        self._cond = asyncio.Condition()
+        self._inflight = 0
+        self._waiting = 0
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probes = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.retries = 0
+        self.throttled = 0
+        self.cut_short = 0
+        self.last_retry_after: Optional[float] = None
+
+    # --- circuit breaker ---
+
+    def _admit_breaker(self) -> bool:
+        """Raise if the breaker rejects; return True if this call is a half-open probe."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now < self._open_until:
+                self.rejected += 1
+                raise UpstreamUnavailable("Upstream circuit open", retry_after=self._open_until - now)
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                raise UpstreamUnavailable("Upstream circuit half-open; probe in flight", retry_after=1.0)
+            self._probes += 1
+            return True
+        return False
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._open_until = time.monotonic() + self.reset_timeout
+
+    # --- outcome bookkeeping ---
+
+    def record_success(self, latency: float) -> None:
+        self.successes += 1
+        self._consecutive_failures = 0
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+        if latency > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._consecutive_failures += 1
+        self.limit = max(self.min_limit, self.limit * 0.5)
+        if self.state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._trip()
+
+    def record_timeout(self, elapsed: float) -> None:
+        """
+        A call cut off by the deadline is an upstream failure only if it ran past the upstream's
+        own timeout or the latency target; earlier than that, the caller's budget was just short.
+        """
+        if elapsed >= min(UPSTREAM_TIMEOUT, self.latency_target):
+            self.record_failure()
+        else:
+            self.cut_short += 1
+
+    def record_response(self, response: httpx.Response, latency: float) -> None:
+        if _is_failure(response.status_code):
+            if response.status_code in RETRYABLE_STATUS:
+                self.throttled += 1
+            self.record_failure()
+        else:
+            self.record_success(latency)
+
+    # --- admission ---
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold one concurrency slot for the duration of an upstream call."""
+        probe = self._admit_breaker()
+        try:
+            async with self._cond:
+                self._waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self._inflight < int(self.limit)),
+                        deadline.timeout(self.queue_timeout),
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise UpstreamUnavailable("Upstream concurrency limit reached", retry_after=1.0)
+                finally:
+                    self._waiting -= 1
+                self._inflight += 1
+        except BaseException:
+            if probe:
+                self._probes -= 1
+            raise
+        try:
+            yield
+        finally:
+            if probe:
+                self._probes -= 1
+            async with self._cond:
+                self._inflight -= 1
+                self._cond.notify_all()
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+        """Delay before the next attempt, or None if we shouldn't retry."""
+        if attempt >= self.max_retries:
+            return None
+        delay = min(self.max_backoff, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            if retry_after is not None:
+                self.last_retry_after = retry_after
+                if retry_after > self.max_backoff:
+                    return None
+                delay = retry_after
+        left = deadline.remaining()
+        if left is not None and delay >= left:
+            return None  # no budget left to retry
+        return delay
+
+    async def request(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Run send() under the guard, retrying 429/503 and transport errors with backoff."""
+        attempt = 0
+        while True:
+            async with self.admit():
+                started = time.monotonic()
+                try:
+                    response = await send()
+                except deadline.DeadlineExceeded:
+                    self.record_timeout(time.monotonic() - started)
+                    raise
+                except httpx.TransportError:
+                    self.record_failure()
+                    delay = self._backoff(attempt, None)
+                    if delay is None:
+                        raise
+                else:
+                    self.record_response(response, time.monotonic() - started)
+                    if response.status_code not in RETRYABLE_STATUS:
+                        return response
+                    delay = self._backoff(attempt, response)
+                    if delay is None:
+                        return response
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+            # The breaker may have opened meanwhile; admit() raises in that case.
+
+    def stats(self) -> dict:
+        open_for = max(0.0, self._open_until - time.monotonic()) if self.state == OPEN else 0.0
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self._inflight,
+            "waiting": self._waiting,
+            "breaker": {
+                "state": self.state,
+                "consecutive_failures": self._consecutive_failures,
+                "open_for_s": round(open_for, 1),
+            },
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "cut_short": self.cut_short,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "last_retry_after": self.last_retry_after,
+        }
@@ -0,0 +1,30 @@
+"""
+Idempotency-Key replay for write endpoints.
+Keys live in the ItemStore next to the items they protect (the SQLite file when
+ITEMS_BACKEND=sqlite), so a retry that lands on another worker still replays. The store
+records the key and the write in one step; a retry with the same key and payload within
+the TTL gets the original response, and concurrent duplicates serialize on that step.
+"""
+import hashlib
+
+_stats = {"replays": 0, "conflicts": 0}
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request payload."""
+
+
+def fingerprint(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def record_replay() -> None:
+    _stats["replays"] += 1
+
+
+def record_conflict() -> None:
+    _stats["conflicts"] += 1
+
+
+def stats() -> dict:
+    return dict(_stats)
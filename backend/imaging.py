@@ -0,0 +1,120 @@
+"""
+Crop preprocessing before upstream vision calls.
+Decodes the client image once (in a worker thread), computes its perceptual hash,
+downsizes it to what the model actually looks at and re-encodes it compactly without metadata.
+"""
+import asyncio
+import base64
+import binascii
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from config import IMAGE_WORKERS, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY, VISION_MAX_SIDE
+from phash_cache import dhash_image
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # images are forwarded untouched without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_WORKERS), thread_name_prefix="imaging")
+
+_stats = {"images": 0, "normalized": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+@dataclass
+class PreparedImage:
+    base64: str
+    mime_type: str
+    phash: Optional[int]
+    bytes_in: int
+    bytes_out: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+
+def _encode(img) -> tuple[bytes, str]:
+    fmt = "WEBP" if VISION_IMAGE_FORMAT == "WEBP" else "JPEG"
+    if img.mode not in ("RGB", "L"):
+        # Flatten transparency onto white; JPEG has no alpha channel.
+        rgba = img.convert("RGBA")
+        bg = Image.new("RGB", rgba.size, (255, 255, 255))
+        bg.paste(rgba, mask=rgba.getchannel("A"))
+        img = bg
+    out = io.BytesIO()
+    # No exif/icc arguments: metadata is dropped on re-encode.
+    if fmt == "WEBP":
+        img.save(out, "WEBP", quality=VISION_IMAGE_QUALITY, method=4)
+    else:
+        img.save(out, "JPEG", quality=VISION_IMAGE_QUALITY, optimize=True)
+    return out.getvalue(), f"image/{fmt.lower()}"
+
+
+def prepare_bytes(raw: bytes, mime_type: str) -> PreparedImage:
+    """Blocking: decode, hash, downsize and re-encode. Falls back to the original bytes."""
+    if Image is None:
+        return PreparedImage(base64.b64encode(raw).decode(), mime_type, None, len(raw), len(raw))
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            img.load()
+            img = ImageOps.exif_transpose(img)
+            phash = dhash_image(img)
+            img.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+            data, out_mime = _encode(img)
+    except Exception:
+        return PreparedImage(base64.b64encode(raw).decode(), mime_type, None, len(raw), len(raw))
+    if len(data) >= len(raw):
+        return PreparedImage(base64.b64encode(raw).decode(), mime_type, phash, len(raw), len(raw))
+    return PreparedImage(base64.b64encode(data).decode(), out_mime, phash, len(raw), len(data))
+
+
+def prepare_base64(image_b64: str, mime_type: str) -> PreparedImage:
+    try:
+        raw = base64.b64decode(image_b64, validate=False)
+    except (binascii.Error, ValueError):
+        return PreparedImage(image_b64, mime_type, None, len(image_b64), len(image_b64))
+    return prepare_bytes(raw, mime_type)
+
+
+def _record(prepared: PreparedImage) -> PreparedImage:
+    _stats["images"] += 1
+    _stats["bytes_in"] += prepared.bytes_in
+    _stats["bytes_out"] += prepared.bytes_out
+    if prepared.bytes_saved:
+        _stats["normalized"] += 1
+    logger.debug("vision image %d -> %d bytes (saved %d)", prepared.bytes_in, prepared.bytes_out, prepared.bytes_saved)
+    return prepared
+
+
+async def prepare(image_b64: str, mime_type: str) -> PreparedImage:
+    """Run prepare_base64 on the imaging pool so decoding never blocks the event loop."""
+    loop = asyncio.get_running_loop()
+    return _record(await loop.run_in_executor(_executor, prepare_base64, image_b64, mime_type))
+
+
+async def prepare_raw(raw: bytes, mime_type: str) -> PreparedImage:
+    """Same as prepare() for images uploaded as raw bytes (no base64 decode)."""
+    loop = asyncio.get_running_loop()
+    return _record(await loop.run_in_executor(_executor, prepare_bytes, raw, mime_type))
+
+
+def stats() -> dict:
+    images = _stats["images"]
+    saved = _stats["bytes_in"] - _stats["bytes_out"]
+    return {
+        "enabled": Image is not None,
+        **_stats,
+        "bytes_saved": saved,
+        "avg_bytes_saved": saved // images if images else 0,
+    }
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
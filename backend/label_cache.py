@@ -0,0 +1,96 @@
+"""
+Product-suggestion cache keyed by the normalized vision label.
+Concurrent misses for the same label share one in-flight upstream request (single-flight).
+"""
+import asyncio
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_label(label: str) -> str:
+    """'  Red, Wireless-Headphones! ' -> 'red wireless headphones'"""
+    text = unicodedata.normalize("NFKC", label or "").casefold()
+    text = _PUNCT.sub(" ", text).replace("_", " ")
+    return _SPACE.sub(" ", text).strip()
+
+
+class LabelCache:
+    """Size-bounded LRU of label -> value with single-flight coalescing of misses."""
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, label: str) -> Optional[Any]:
+        key = normalize_label(label)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        return None
+
+    def put(self, label: str, value: Any) -> None:
+        self._put(normalize_label(label), value)
+
+    def _put(self, key: str, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_fetch(self, label: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for label, or run fetch() once for all concurrent callers.
+        Falsy results (e.g. an empty list after an upstream error) are shared but not cached.
+        """
+        key = normalize_label(label)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        fut = self._inflight.get(key)
+        if fut is None:
+            self.misses += 1
+            fut = asyncio.ensure_future(fetch())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._on_done(key, f))
+        else:
+            self.coalesced += 1
+        # shield: one waiter disconnecting must not cancel the shared request
+        return await asyncio.shield(fut)
+
+    def _on_done(self, key: str, fut: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        result = fut.result()
+        if result:
+            self._put(key, result)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
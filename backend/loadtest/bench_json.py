@@ -0,0 +1,93 @@
+"""
+Microbenchmark: JSON response rendering and request decoding, stdlib path vs the fastjson path.
+
+    python -m loadtest.bench_json --sizes 10 100 1000 --image-kb 24
+
+Responses: FastAPI's default (jsonable_encoder + json.dumps via JSONResponse) against
+FastJSONResponse rendering the same list of item/bookmark-shaped dicts, each carrying a
+base64 image of --image-kb. Requests: json.loads + model_validate (what FastAPI does for a
+body parameter) against model_validate_json on the raw bytes.
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from fastjson import FastJSONResponse  # noqa: E402
+from routes.analyze import AnalyzeRequest  # noqa: E402
+
+
+def make_rows(count: int, image_kb: int) -> list[dict]:
+    image = base64.b64encode(os.urandom(image_kb * 1024 * 3 // 4)).decode()
+    return [
+        {
+            "id": f"item-{i}",
+            "type": "product",
+            "title": f"Wireless headphones {i}",
+            "description": "Over-ear, noise cancelling",
+            "metadata": {"image": image, "price": "$129.99", "tags": ["audio", "travel"]},
+            "source_url": f"https://example.com/p/{i}",
+            "board_id": "board-1",
+            "created_at": "2026-01-01 12:00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def timeit(fn, repeat: int) -> float:
+    """Median seconds per call."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def bench_responses(sizes: list[int], image_kb: int, repeat: int) -> list[dict]:
+    out = []
+    for n in sizes:
+        content = {"items": make_rows(n, image_kb), "next_cursor": None}
+        stdlib = timeit(lambda: JSONResponse(jsonable_encoder(content)), repeat)
+        fast = timeit(lambda: FastJSONResponse(content), repeat)
+        body_bytes = len(FastJSONResponse(content).body)
+        out.append({"rows": n, "bytes": body_bytes, "stdlib_ms": stdlib * 1e3, "fast_ms": fast * 1e3})
+    return out
+
+
+def bench_requests(image_kb: int, repeat: int) -> dict:
+    image = base64.b64encode(os.urandom(image_kb * 1024 * 3 // 4)).decode()
+    raw = json.dumps({"image": image, "intent": "product", "mimeType": "image/png"}).encode()
+    stdlib = timeit(lambda: AnalyzeRequest.model_validate(json.loads(raw)), repeat)
+    fast = timeit(lambda: AnalyzeRequest.model_validate_json(raw), repeat)
+    return {"bytes": len(raw), "stdlib_ms": stdlib * 1e3, "fast_ms": fast * 1e3}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--image-kb", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'bytes':>12} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+    for r in bench_responses(args.sizes, args.image_kb, args.repeat):
+        print(f"{r['rows']:>6} {r['bytes']:>12} {r['stdlib_ms']:>10.2f} {r['fast_ms']:>10.2f} "
+              f"{r['stdlib_ms'] / r['fast_ms']:>7.1f}x")
+    for kb in sorted({4, args.image_kb, args.image_kb * 8}):
+        r = bench_requests(kb, args.repeat)
+        print(f"AnalyzeRequest decode {r['bytes']:>9} B: stdlib {r['stdlib_ms']:.3f} ms, "
+              f"model_validate_json {r['fast_ms']:.3f} ms ({r['stdlib_ms'] / r['fast_ms']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Local stand-in for the Dedalus chat-completions endpoint, for load tests without API credits.
+
+Run:
+    FAKE_LATENCY=lognormal:0.8:0.4 FAKE_ERROR_RATE=0.01 FAKE_429_RATE=0.02 \\
+        uvicorn loadtest.fake_dedalus:app --port 9100
+
+then start the backend with DEDALUS_API_URL=http://127.0.0.1:9100/v1/chat/completions.
+
+Latency specs (seconds): fixed:0.5 | uniform:0.2:1.5 | lognormal:<median>:<sigma>
+Requests with "stream": true get an SSE response split into FAKE_STREAM_CHUNKS deltas.
+GET /stats returns call counters; POST /stats/reset clears them.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+from typing import Callable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LABELS = ["red wireless headphones", "blue leather handbag", "beach sunset", "white running shoes", "espresso machine"]
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, _, rest = spec.partition(":")
+    args = [float(a) for a in rest.split(":") if a]
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class FakeConfig:
+    def __init__(self):
+        self.latency = parse_latency(os.getenv("FAKE_LATENCY", "lognormal:0.6:0.35"))
+        self.error_rate = float(os.getenv("FAKE_ERROR_RATE", "0"))
+        self.throttle_rate = float(os.getenv("FAKE_429_RATE", "0"))
+        self.retry_after = os.getenv("FAKE_RETRY_AFTER", "1")
+        self.stream_chunks = int(os.getenv("FAKE_STREAM_CHUNKS", "8"))
+
+
+config = FakeConfig()
+stats = {"calls": 0, "vision": 0, "products": 0, "combined": 0, "streamed": 0, "errors": 0, "throttled": 0}
+
+app = FastAPI(title="Fake Dedalus")
+
+
+def _reply_for(body: dict) -> tuple[str, str]:
+    content = body["messages"][0]["content"]
+    if isinstance(content, list):
+        prompt = next((c.get("text", "") for c in content if c.get("type") == "text"), "")
+        label = random.choice(LABELS)
+        if "JSON object" in prompt:
+            products = [{"name": f"{label} {i}", "search_query": f"{label} option {i}"} for i in range(1, 5)]
+            return "combined", json.dumps({"label": label, "products": products})
+        return "vision", label
+    products = [{"name": f"Product {i}", "search_query": f"query {i}"} for i in range(1, 5)]
+    return "products", json.dumps(products)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["calls"] += 1
+    await asyncio.sleep(max(0.0, config.latency()))
+    roll = random.random()
+    if roll < config.throttle_rate:
+        stats["throttled"] += 1
+        return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": config.retry_after})
+    if roll < config.throttle_rate + config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse({"error": "upstream error"}, status_code=503)
+    kind, text = _reply_for(body)
+    stats[kind] += 1
+    if not body.get("stream"):
+        return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+    stats["streamed"] += 1
+    n = max(1, config.stream_chunks)
+    size = math.ceil(len(text) / n)
+
+    async def events():
+        for i in range(0, len(text), size):
+            chunk = {"choices": [{"delta": {"content": text[i:i + size]}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0.01)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+@app.post("/stats/reset")
+def reset_stats():
+    for k in stats:
+        stats[k] = 0
+    return stats
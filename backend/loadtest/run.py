@@ -0,0 +1,196 @@
+"""
+Open-loop asyncio load generator for the /analyze path.
+
+    python -m loadtest.run --spawn --rps 20 --duration 30 --out loadtest-results.json
+
+--spawn starts loadtest.fake_dedalus and the backend (REQUIRE_AUTH=0, pointed at the fake) as
+subprocesses; otherwise --target and --fake-url must point at running instances.
+Requests are issued on a fixed schedule regardless of response times, so queueing shows up
+as latency instead of as reduced offered load.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_images(count: int, size: int = 320) -> list[str]:
+    """Distinct base64 PNG crops; falls back to a 1x1 PNG without Pillow."""
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        tiny = base64.b64encode(bytes.fromhex(
+            "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+            "1f15c4890000000d49444154789c63f8cfc0f01f0005000201e527de"
+            "fc0000000049454e44ae426082"
+        )).decode()
+        return [tiny] * count
+    rng = random.Random(42)
+    out = []
+    for _ in range(count):
+        img = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(6):
+            x, y = rng.randrange(size), rng.randrange(size)
+            draw.ellipse((x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 120)),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        out.append(base64.b64encode(buf.getvalue()).decode())
+    return out
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def _one(client: httpx.AsyncClient, url: str, payload: dict, results: list) -> None:
+    started = time.perf_counter()
+    try:
+        r = await client.post(url, json=payload)
+        status = r.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    results.append((time.perf_counter() - started, status))
+
+
+async def run_load(args) -> dict:
+    images = make_images(args.unique_images)
+    url = args.target.rstrip("/") + args.path
+    results: list = []
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        if args.fake_url:
+            await client.post(args.fake_url.rstrip("/") + "/stats/reset")
+        total = int(args.rps * args.duration)
+        tasks = []
+        t0 = time.perf_counter()
+        for i in range(total):
+            delay = t0 + i / args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = {"image": random.choice(images), "mimeType": "image/png"}
+            if args.mode:
+                payload["mode"] = args.mode
+            tasks.append(asyncio.create_task(_one(client, url, payload, results)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+        upstream = (await client.get(args.fake_url.rstrip("/") + "/stats")).json() if args.fake_url else None
+        health = None
+        try:
+            health = (await client.get(args.target.rstrip("/") + "/health")).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+
+    latencies = sorted(lat for lat, _ in results)
+    statuses: dict[str, int] = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = statuses.get("200", 0)
+    return {
+        "config": {
+            "target": url,
+            "rps": args.rps,
+            "duration": args.duration,
+            "unique_images": args.unique_images,
+            "mode": args.mode,
+        },
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "ok_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round((latencies[-1] if latencies else 0.0) * 1000, 1),
+        },
+        "upstream_calls": upstream,
+        "upstream_calls_per_request": round(upstream["calls"] / len(results), 3) if upstream and results else None,
+        "backend_health": health,
+    }
+
+
+def _spawn(args) -> list[subprocess.Popen]:
+    fake_port, backend_port = args.fake_port, args.backend_port
+    env = dict(os.environ)
+    procs = [subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "loadtest.fake_dedalus:app", "--port", str(fake_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )]
+    env.update({
+        "DEDALUS_API_URL": f"http://127.0.0.1:{fake_port}/v1/chat/completions",
+        "DEDALUS_API_KEY": env.get("DEDALUS_API_KEY") or "loadtest",
+        "REQUIRE_AUTH": "0",
+        # every request shares one user; admission control would cap the offered load
+        "ANALYZE_RATE": env.get("ANALYZE_RATE", "0"),
+        "ANALYZE_DAILY_QUOTA": env.get("ANALYZE_DAILY_QUOTA", "0"),
+    })
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    ))
+    args.target = f"http://127.0.0.1:{backend_port}"
+    args.fake_url = f"http://127.0.0.1:{fake_port}"
+    deadline = time.monotonic() + 20
+    for url in (args.fake_url + "/stats", args.target + "/health"):
+        while True:
+            try:
+                if httpx.get(url, timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"Timed out waiting for {url}")
+            time.sleep(0.2)
+    return procs
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="backend base URL")
+    parser.add_argument("--fake-url", default=None, help="fake Dedalus base URL, for upstream call counts")
+    parser.add_argument("--path", default="/analyze")
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--unique-images", type=int, default=50, help="distinct crops to cycle through")
+    parser.add_argument("--mode", choices=["two_step", "combined"], default=None)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--spawn", action="store_true", help="start the fake upstream and the backend")
+    parser.add_argument("--fake-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    procs = _spawn(args) if args.spawn else []
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
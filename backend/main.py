@@ -1,19 +1,64 @@
 """
 Backend API for Lens Capture / entertainment media scanner.
 - POST /analyze: image + intent → vision description + product/location results
+- POST /analyze/stream: same, as Server-Sent Events (also via Accept: text/event-stream)
+- POST /analyze/upload: same, with the image as raw bytes (multipart or octet-stream)
+- POST /analyze/batch: many crops at once, per-item results (optionally streamed)
 - POST /items: save an item (product or location)
 - GET /items: list saved items for the authenticated user
+- GET /items/{id}/image, /items/{id}/thumbnail: images saved inline in item metadata
 """
-from fastapi import FastAPI, HTTPException, Depends, Header
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from config import DEDALUS_API_KEY, REQUIRE_AUTH
+from config import (
+    ANALYZE_DEADLINE,
+    DEDALUS_API_KEY,
+    ITEMS_BULK_MAX_OPS,
+    ITEMS_DEFAULT_PAGE,
+    ITEMS_MAX_PAGE,
+    REQUIRE_AUTH,
+    UPSTREAM_PREWARM,
+)
+from fastjson import FastJSONResponse, body_schema, json_body
 from routes import analyze, items
+import deadline
+import imaging
+import ratelimit
+import storage
+import thumbnails
+import timing
+import upstream
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # everything here completes before uvicorn starts accepting on this worker
+    await upstream.start()
+    await upstream.prewarm(UPSTREAM_PREWARM)
+    await storage.get_store().prewarm()
+    await items.feed.start(storage.get_store())
+    ratelimit.get_limiter()
+    try:
+        yield
+    finally:
+        items.feed.close()
+        await upstream.stop()
+        await storage.close_store()
+        await ratelimit.close_limiter()
+        imaging.shutdown()
+        thumbnails.shutdown()
+
 
 app = FastAPI(
     title="Lens Capture API",
     description="Analyze on-screen media and save products/locations",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 app.add_middleware(
@@ -22,7 +67,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(timing.TimingMiddleware)
 
 
 def get_user_id(authorization: str | None = Header(default=None)) -> str | None:
@@ -34,39 +81,192 @@ def get_user_id(authorization: str | None = Header(default=None)) -> str | None:
     return authorization.replace("Bearer ", "").strip() or None
 
 
+async def analyze_deadline(x_request_timeout: str | None = Header(default=None)) -> float:
+    """Start the request deadline: X-Request-Timeout seconds from the caller, capped by ANALYZE_DEADLINE."""
+    return deadline.start_from_header(x_request_timeout, ANALYZE_DEADLINE)
+
+
+async def admit(user_id: str | None, endpoint: str, cost: int = 1) -> None:
+    """Per-user token bucket and daily image quota; 429 with Retry-After when over."""
+    try:
+        await ratelimit.get_limiter().admit(user_id, endpoint, cost)
+    except ratelimit.RateLimited as e:
+        raise HTTPException(status_code=429, detail=e.detail, headers=ratelimit.retry_after_header(e.retry_after))
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "upstream_pool": upstream.pool_stats(),
+        "analyze_cache": analyze.result_cache.stats(),
+        "product_cache": analyze.product_cache.stats(),
+        "imaging": imaging.stats(),
+        "thumbnails": thumbnails.stats(),
+        "analyze_modes": analyze.mode_stats(),
+        "upstream_guard": analyze.guard.stats(),
+        "idempotency": items.idempotency.stats(),
+        "changefeed": items.feed.stats(),
+        "rate_limit": ratelimit.get_limiter().stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-stage and per-route latency histograms (this worker), Prometheus text format."""
+    return PlainTextResponse(timing.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 
-@app.post("/analyze")
+@app.post("/analyze", openapi_extra=body_schema(analyze.AnalyzeRequest))
 async def analyze_image(
-    body: analyze.AnalyzeRequest,
+    request: Request,
+    body: analyze.AnalyzeRequest = Depends(json_body(analyze.AnalyzeRequest)),
     user_id: str | None = Depends(get_user_id),
+    _budget: float = Depends(analyze_deadline),
 ):
     if REQUIRE_AUTH and not user_id:
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    await admit(user_id, "analyze")
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return analyze.analyze_stream_response(body, user_id, DEDALUS_API_KEY)
     return await analyze.analyze(body, user_id, DEDALUS_API_KEY)
 
 
+@app.post("/analyze/stream", openapi_extra=body_schema(analyze.AnalyzeRequest))
+async def analyze_image_stream(
+    body: analyze.AnalyzeRequest = Depends(json_body(analyze.AnalyzeRequest)),
+    user_id: str | None = Depends(get_user_id),
+    _budget: float = Depends(analyze_deadline),
+):
+    """SSE: `description`, then `product` events as they are parsed, then `done`."""
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    await admit(user_id, "analyze_stream")
+    return analyze.analyze_stream_response(body, user_id, DEDALUS_API_KEY)
+
+
+@app.post("/analyze/upload")
+async def analyze_image_upload(
+    request: Request,
+    user_id: str | None = Depends(get_user_id),
+    _budget: float = Depends(analyze_deadline),
+):
+    """Binary variant of /analyze: multipart `image` part or a raw image/* / octet-stream body."""
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    await admit(user_id, "analyze_upload")
+    stream = "text/event-stream" in request.headers.get("accept", "")
+    mode = request.headers.get("x-analyze-mode") or None
+    return await analyze.analyze_upload(request, user_id, DEDALUS_API_KEY, stream=stream, mode=mode)
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    body: analyze.AnalyzeBatchRequest,
+    request: Request,
+    user_id: str | None = Depends(get_user_id),
+    x_request_timeout: str | None = Header(default=None),
+):
+    """
+    Analyze many crops with bounded upstream concurrency; SSE per item with Accept: text/event-stream.
+    X-Request-Timeout bounds the whole batch; without it the batch gets ANALYZE_DEADLINE per wave.
+    """
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    analyze.check_batch(body, DEDALUS_API_KEY)
+    deadline.start_from_header(x_request_timeout, analyze.batch_deadline(body))
+    await admit(user_id, "analyze_batch", cost=len(body.items))
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return analyze.analyze_batch_stream_response(body, user_id, DEDALUS_API_KEY)
+    return await analyze.analyze_batch(body, user_id, DEDALUS_API_KEY)
+
+
 @app.post("/items")
 async def save_item(
     body: items.SaveItemRequest,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    user_id: str | None = Depends(get_user_id),
+):
+    """Save an item. Retries carrying the same Idempotency-Key replay the first response."""
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    result, replayed = await items.save_item(body, user_id, idempotency_key)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+@app.post("/items/bulk")
+async def bulk_items(
+    body: items.BulkRequest,
     user_id: str | None = Depends(get_user_id),
 ):
+    """Apply many save/move/delete/move_all ops in one pass; per-op results."""
     if REQUIRE_AUTH and not user_id:
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    return await items.save_item(body, user_id)
+    if len(body.ops) > ITEMS_BULK_MAX_OPS:
+        raise HTTPException(status_code=413, detail=f"Bulk request exceeds {ITEMS_BULK_MAX_OPS} ops")
+    return await items.bulk(body, user_id)
+
+
+@app.get("/items/events")
+async def item_events(user_id: str | None = Depends(get_user_id)):
+    """
+    SSE change feed: `item.saved`, `item.moved`, `item.deleted`, `board.created`,
+    `board.deleted`, `board.items_moved`; `resync` means refetch /boards and /items.
+    """
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    return items.events_response(user_id)
 
 
 @app.get("/items")
 async def list_items(
     board_id: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=ITEMS_MAX_PAGE),
+    cursor: str | None = None,
+    fields: str | None = Query(default=None, description="Comma-separated projection, e.g. id,title,board_id"),
+    all_items: bool = Query(default=False, alias="all", description="Return the whole collection unpaged"),
     user_id: str | None = Depends(get_user_id),
 ):
+    """One keyset page (ITEMS_DEFAULT_PAGE items unless limit is given) and next_cursor; all=true opts out."""
     if REQUIRE_AUTH and not user_id:
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    return await items.list_items(user_id, board_id)
+    page_size = None if all_items else (limit or ITEMS_DEFAULT_PAGE)
+    # plain dicts: render directly, skipping FastAPI's jsonable_encoder pass over every item
+    return FastJSONResponse(await items.list_items(user_id, board_id, page_size, cursor, fields))
+
+
+# an item's blobs never change once stored (the id is new on every save)
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+@app.get("/items/{item_id}/image")
+async def item_image(item_id: str, user_id: str | None = Depends(get_user_id)):
+    """Original of the image that was sent inline in the item's metadata."""
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    image = await items.get_image(item_id, user_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(image[0], media_type=image[1], headers={"Cache-Control": IMMUTABLE})
+
+
+@app.get("/items/{item_id}/thumbnail")
+async def item_thumbnail(
+    item_id: str,
+    size: int | None = Query(default=None, ge=1, description="Longest side in px; the nearest configured size is served"),
+    user_id: str | None = Depends(get_user_id),
+):
+    """Thumbnail of the item's image; the original (briefly cached) until it has been rendered."""
+    if REQUIRE_AUTH and not user_id:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    thumb = await items.get_thumbnail(item_id, user_id, size)
+    if not thumb:
+        raise HTTPException(status_code=404, detail="Image not found")
+    data, mime, final = thumb
+    return Response(data, media_type=mime, headers={"Cache-Control": IMMUTABLE if final else "private, max-age=60"})
 
 
 @app.patch("/items/{item_id}")
@@ -83,10 +283,13 @@ async def move_item(
 
 
 @app.get("/boards")
-async def list_boards(user_id: str | None = Depends(get_user_id)):
+async def list_boards(
+    summary: bool = Query(default=False, description="Include item_count, latest_at and cover per board"),
+    user_id: str | None = Depends(get_user_id),
+):
     if REQUIRE_AUTH and not user_id:
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    return await items.list_boards(user_id)
+    return await items.list_boards(user_id, summary)
 
 
 @app.post("/boards")
@@ -122,6 +325,6 @@ async def delete_item(
 
 
 if __name__ == "__main__":
-    import uvicorn
-    from config import HOST, PORT
-    uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
+    # development: python main.py --reload; production: python serve.py
+    import serve
+    serve.main()
@@ -0,0 +1,145 @@
+"""
+Near-duplicate result cache for /analyze, keyed by a perceptual hash (dHash) of the crop.
+Lookups tolerate small Hamming distances, so re-crops of the same frame hit the cache.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # cache is disabled without Pillow
+    Image = None
+
+HASH_BITS = 64
+# Flat or low-texture crops have (almost) no gradient sign changes, so every such crop hashes
+# to near all-0 or all-1 regardless of colour; those are neither looked up nor stored.
+MIN_TEXTURE_BITS = 8
+
+
+def is_degenerate(h: int) -> bool:
+    ones = h.bit_count()
+    return ones < MIN_TEXTURE_BITS or ones > HASH_BITS - MIN_TEXTURE_BITS
+
+
+def dhash_image(img, hash_size: int = 8) -> int:
+    """dHash of an already decoded PIL image."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    px = small.tobytes()
+    value = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        base = row * width
+        for col in range(hash_size):
+            value = (value << 1) | (px[base + col] > px[base + col + 1])
+    return value
+
+
+class PerceptualCache:
+    """
+    LRU + TTL cache over 64-bit perceptual hashes with near-duplicate lookup.
+
+    Near neighbours are found with multi-index hashing: the hash is split into
+    max_distance + 1 chunks, so by pigeonhole any hash within max_distance
+    shares at least one chunk exactly with the query.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, max_distance: int = 4):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: OrderedDict[int, tuple[float, Any]] = OrderedDict()
+        n = max_distance + 1
+        step, extra = divmod(HASH_BITS, n)
+        self._chunks: list[tuple[int, int]] = []  # (shift, mask)
+        shift = 0
+        for i in range(n):
+            width = step + (1 if i < extra else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self._index: list[dict[int, set[int]]] = [{} for _ in self._chunks]
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _keys(self, h: int):
+        for i, (shift, mask) in enumerate(self._chunks):
+            yield i, (h >> shift) & mask
+
+    def _remove(self, h: int) -> None:
+        self._entries.pop(h, None)
+        for i, key in self._keys(h):
+            bucket = self._index[i].get(key)
+            if bucket is not None:
+                bucket.discard(h)
+                if not bucket:
+                    del self._index[i][key]
+
+    def _nearest(self, h: int) -> Optional[int]:
+        if h in self._entries:
+            return h
+        best, best_dist = None, self.max_distance + 1
+        seen: set[int] = set()
+        for i, key in self._keys(h):
+            for cand in self._index[i].get(key, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                dist = (cand ^ h).bit_count()
+                if dist < best_dist:
+                    best, best_dist = cand, dist
+        return best
+
+    def get(self, h: int) -> Optional[Any]:
+        if is_degenerate(h):
+            self.skipped += 1
+            return None
+        found = self._nearest(h)
+        if found is None:
+            self.misses += 1
+            return None
+        expires_at, value = self._entries[found]
+        if expires_at < time.monotonic():
+            self._remove(found)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(found)
+        self.hits += 1
+        if found != h:
+            self.near_hits += 1
+        return value
+
+    def put(self, h: int, value: Any) -> None:
+        if self.max_size <= 0 or is_degenerate(h):
+            return
+        if h in self._entries:
+            self._remove(h)
+        self._entries[h] = (time.monotonic() + self.ttl, value)
+        for i, key in self._keys(h):
+            self._index[i].setdefault(key, set()).add(h)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": Image is not None and self.max_size > 0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
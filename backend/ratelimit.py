@@ -0,0 +1,275 @@
+"""
+Per-user admission control for the /analyze endpoints:
+- token bucket per (user, endpoint): `rate` tokens/second refill up to `burst`
+- daily quota per user on analyzed images (UTC days), since each one costs upstream calls
+
+State lives behind RateLimitBackend: in-process by default, or a shared SQLite file
+(RATE_LIMIT_BACKEND=sqlite) so every uvicorn worker on the host draws from the same buckets.
+"""
+import asyncio
+import datetime
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import (
+    ANALYZE_BURST,
+    ANALYZE_DAILY_QUOTA,
+    ANALYZE_RATE,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_DB_PATH,
+    RATE_LIMIT_MAX_KEYS,
+)
+
+
+class RateLimited(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: float, cost: float, now: float) -> float:
+        """Take cost tokens from the bucket; 0.0 if granted, else seconds until it would be."""
+
+    @abstractmethod
+    async def refund(self, key: str, rate: float, burst: float, cost: float, now: float) -> None:
+        """Return cost tokens taken by a request that was refused afterwards (capped at burst)."""
+
+    @abstractmethod
+    async def charge(self, key: str, day: str, cost: int, limit: int) -> Optional[int]:
+        """Add cost to key's usage for day if it stays within limit; new usage, or None if refused."""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process buckets. Buckets that have refilled completely carry no state and are swept."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: dict[str, tuple[float, float, float]] = {}  # key -> (tokens, updated_at, full_at)
+        self._usage: dict[str, int] = {}
+        self._day: Optional[str] = None
+
+    async def take(self, key: str, rate: float, burst: float, cost: float, now: float) -> float:
+        tokens, updated_at, _ = self._buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        if tokens < cost:
+            return (cost - tokens) / rate
+        tokens -= cost
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        if len(self._buckets) > self.max_keys:
+            self._sweep(now)
+        return 0.0
+
+    async def refund(self, key: str, rate: float, burst: float, cost: float, now: float) -> None:
+        if key not in self._buckets:
+            return  # swept: already full
+        tokens, updated_at, _ = self._buckets[key]
+        tokens = min(burst, tokens + (now - updated_at) * rate + cost)
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+
+    def _sweep(self, now: float) -> None:
+        self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        if len(self._buckets) > self.max_keys:
+            # everyone is mid-refill: forget the fullest half (they are closest to no state anyway)
+            keep = sorted(self._buckets.items(), key=lambda kv: kv[1][2], reverse=True)[: self.max_keys // 2]
+            self._buckets = dict(keep)
+
+    async def charge(self, key: str, day: str, cost: int, limit: int) -> Optional[int]:
+        if day != self._day:
+            self._usage.clear()
+            self._day = day
+        used = self._usage.get(key, 0) + cost
+        if used > limit:
+            return None
+        self._usage[key] = used
+        return used
+
+
+class SQLiteBackend(RateLimitBackend):
+    """Buckets and usage in a WAL SQLite file shared by all workers; each check is one IMMEDIATE transaction."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS quota_usage (
+        key TEXT NOT NULL, day TEXT NOT NULL, used INTEGER NOT NULL, PRIMARY KEY (key, day)
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # one writer thread: the checks serialize on the write lock anyway
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ratelimit-db")
+        self._conns: list[sqlite3.Connection] = []
+        self._conn().executescript(self.SCHEMA)
+        self._pruned_day: Optional[str] = None
+        self._pruned_buckets_day: Optional[str] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._conns.append(conn)
+        return conn
+
+    async def _run(self, fn):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self._transaction(fn))
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    async def take(self, key: str, rate: float, burst: float, cost: float, now: float) -> float:
+        day = _utc_day(now)[0]
+        prune = day != self._pruned_buckets_day
+        self._pruned_buckets_day = day
+
+        def op(conn):
+            if prune:
+                # once a day, like quota_usage: a bucket idle long enough to refill carries no state
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - burst / rate,))
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens < cost:
+                return (cost - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens - cost, now),
+            )
+            return 0.0
+        return await self._run(op)
+
+    async def refund(self, key: str, rate: float, burst: float, cost: float, now: float) -> None:
+        def op(conn):
+            conn.execute(
+                "UPDATE rate_buckets SET tokens = MIN(?, tokens + (? - updated_at) * ? + ?), updated_at = ?"
+                " WHERE key = ?",
+                (burst, now, rate, cost, now, key),
+            )
+        await self._run(op)
+
+    async def charge(self, key: str, day: str, cost: int, limit: int) -> Optional[int]:
+        prune = day != self._pruned_day
+        self._pruned_day = day
+
+        def op(conn):
+            if prune:
+                conn.execute("DELETE FROM quota_usage WHERE day < ?", (day,))
+            row = conn.execute("SELECT used FROM quota_usage WHERE key = ? AND day = ?", (key, day)).fetchone()
+            used = (row[0] if row else 0) + cost
+            if used > limit:
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO quota_usage (key, day, used) VALUES (?, ?, ?)", (key, day, used)
+            )
+            return used
+        return await self._run(op)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        for conn in self._conns:
+            conn.close()
+        self._conns.clear()
+
+
+def _utc_day(now: float) -> tuple[str, float]:
+    """(YYYY-MM-DD, seconds until the next UTC midnight)."""
+    dt = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+    midnight = datetime.datetime.combine(dt.date() + datetime.timedelta(days=1), datetime.time(), datetime.timezone.utc)
+    return dt.date().isoformat(), (midnight - dt).total_seconds()
+
+
+class RateLimiter:
+    """
+    Token bucket per (user, endpoint) plus a per-user daily image quota.
+    rate <= 0 disables the bucket; daily_quota <= 0 disables the quota.
+    """
+
+    def __init__(self, backend: RateLimitBackend, rate: float, burst: float, daily_quota: int):
+        self.backend = backend
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.daily_quota = daily_quota
+        self.allowed: dict[str, int] = {}
+        self.limited: dict[str, int] = {}
+        self.quota_exceeded = 0
+
+    async def admit(self, user_id: Optional[str], endpoint: str, cost: int = 1) -> None:
+        """Charge one request of `cost` images, or raise RateLimited with a Retry-After."""
+        user = user_id or "anonymous"
+        now = time.time()
+        key = f"{user}:{endpoint}"
+        # a batch bigger than the burst drains the bucket rather than never fitting
+        tokens = min(cost, self.burst)
+        if self.rate > 0:
+            wait = await self.backend.take(key, self.rate, self.burst, tokens, now)
+            if wait > 0:
+                self.limited[endpoint] = self.limited.get(endpoint, 0) + 1
+                raise RateLimited(f"Rate limit exceeded for {endpoint}", wait)
+        if self.daily_quota > 0:
+            day, until_reset = _utc_day(now)
+            if await self.backend.charge(user, day, cost, self.daily_quota) is None:
+                if self.rate > 0:
+                    await self.backend.refund(key, self.rate, self.burst, tokens, now)
+                self.quota_exceeded += 1
+                raise RateLimited(f"Daily quota of {self.daily_quota} images exceeded", until_reset)
+        self.allowed[endpoint] = self.allowed.get(endpoint, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "rate": self.rate,
+            "burst": self.burst,
+            "daily_quota": self.daily_quota,
+            "allowed": dict(self.allowed),
+            "limited": dict(self.limited),
+            "quota_exceeded": self.quota_exceeded,
+        }
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        if RATE_LIMIT_BACKEND == "sqlite":
+            backend: RateLimitBackend = SQLiteBackend(RATE_LIMIT_DB_PATH)
+        elif RATE_LIMIT_BACKEND == "memory":
+            backend = MemoryBackend(max_keys=RATE_LIMIT_MAX_KEYS)
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+        _limiter = RateLimiter(backend, rate=ANALYZE_RATE, burst=ANALYZE_BURST, daily_quota=ANALYZE_DAILY_QUOTA)
+    return _limiter
+
+
+async def close_limiter() -> None:
+    global _limiter
+    if _limiter is not None:
+        await _limiter.backend.close()
+        _limiter = None
@@ -1,30 +1,90 @@
+import asyncio
 import json
+import math
 import re
+import time
+from typing import AsyncIterator, Literal, Optional
+
 import httpx
-from fastapi import HTTPException
+import orjson
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+import deadline
+import imaging
+import timing
+import upstream
+from deadline import DeadlineExceeded
+from guard import UpstreamGuard, UpstreamUnavailable
+from config import (
+    ANALYZE_BATCH_CONCURRENCY,
+    ANALYZE_BATCH_MAX_ITEMS,
+    ANALYZE_CACHE_MAX_DISTANCE,
+    ANALYZE_CACHE_SIZE,
+    ANALYZE_CACHE_TTL,
+    ANALYZE_DEADLINE,
+    ANALYZE_MODE,
+    DEDALUS_API_URL,
+    MAX_UPLOAD_BYTES,
+    PRODUCT_CACHE_SIZE,
+    PRODUCTS_MIN_BUDGET,
+    UPSTREAM_TIMEOUT,
+)
+from label_cache import LabelCache
+from phash_cache import PerceptualCache
+
 DEDALUS_VISION_MODEL = "google/gemini-2.0-flash"
-DEDALUS_API = "https://api.dedaluslabs.ai/v1/chat/completions"
+DEDALUS_API = DEDALUS_API_URL
+
+result_cache = PerceptualCache(
+    max_size=ANALYZE_CACHE_SIZE,
+    ttl=ANALYZE_CACHE_TTL,
+    max_distance=ANALYZE_CACHE_MAX_DISTANCE,
+)
+product_cache = LabelCache(max_size=PRODUCT_CACHE_SIZE)
+guard = UpstreamGuard()
+# Shared across all batches so concurrent batch requests can't multiply upstream load.
+_batch_semaphore = asyncio.Semaphore(max(1, ANALYZE_BATCH_CONCURRENCY))
 
 
 class AnalyzeRequest(BaseModel):
     image: str  # base64
     intent: str = "product"  # "product" | "location"
     mimeType: str = "image/png"
+    mode: Optional[Literal["two_step", "combined"]] = None  # default: ANALYZE_MODE
 
 
-async def call_dedalus_vision(api_key: str, base64_image: str, mime_type: str) -> str:
-    body = {
+class AnalyzeBatchRequest(BaseModel):
+    items: list[AnalyzeRequest]
+
+
+def _headers(api_key: str) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+
+
+async def _post_chat(api_key: str, body: dict) -> httpx.Response:
+    """POST a chat completion over the shared upstream pool, under the upstream guard and request deadline."""
+    client = upstream.get_client()
+    return await guard.request(
+        lambda: deadline.bounded(client.post(DEDALUS_API, json=body, headers=_headers(api_key)), UPSTREAM_TIMEOUT)
+    )
+
+
+def _vision_body(prompt: str, base64_image: str, mime_type: str, max_tokens: int) -> dict:
+    return {
         "model": DEDALUS_VISION_MODEL,
-        "max_tokens": 50,
+        "max_tokens": max_tokens,
         "messages": [
             {
                 "role": "user",
                 "content": [
                     {
                         "type": "text",
-                        "text": "In 3-6 words, name what this image shows. Examples: 'red wireless headphones', 'beach sunset', 'blue leather handbag'. Reply with ONLY the short label, nothing else.",
+                        "text": prompt,
                     },
                     {
                         "type": "image_url",
@@ -37,26 +97,83 @@ async def call_dedalus_vision(api_key: str, base64_image: str, mime_type: str) -
             }
         ],
     }
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            DEDALUS_API,
-            json=body,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-            },
-            timeout=30.0,
-        )
+
+
+async def _vision_content(api_key: str, body: dict) -> str:
+    r = await _post_chat(api_key, body)
     if r.status_code != 200:
         raise ValueError(f"{r.status_code} {r.text}")
     data = r.json()
     content = (data.get("choices") or [{}])[0].get("message", {}).get("content")
     if not isinstance(content, str):
         raise ValueError("Invalid Dedalus response")
+    return content
+
+
+async def call_dedalus_vision(api_key: str, base64_image: str, mime_type: str) -> str:
+    prompt = "In 3-6 words, name what this image shows. Examples: 'red wireless headphones', 'beach sunset', 'blue leather handbag'. Reply with ONLY the short label, nothing else."
+    with timing.span("vision"):
+        content = await _vision_content(api_key, _vision_body(prompt, base64_image, mime_type, 50))
     return content.strip()
 
 
+async def call_dedalus_combined(api_key: str, base64_image: str, mime_type: str) -> tuple[Optional[str], list[dict]]:
+    """
+    One multimodal call returning both the label and the products.
+    Returns (None, []) when the reply can't be parsed, so the caller can fall back.
+    """
+    prompt = (
+        "In 3-6 words, name what this image shows (e.g. 'red wireless headphones'), then suggest "
+        "3 to 5 similar or related products that could be purchased online, each with a short name "
+        "and a search query (keywords). Reply with ONLY a valid JSON object of the form "
+        '{"label": "...", "products": [{"name": "...", "search_query": "..."}]}'
+    )
+    with timing.span("combined"):
+        content = await _vision_content(api_key, _vision_body(prompt, base64_image, mime_type, 600))
+    with timing.span("parse"):
+        return _parse_combined(content)
+
+
+def _parse_combined(text: str) -> tuple[Optional[str], list[dict]]:
+    trimmed = (text or "").strip()
+    code = re.search(r"```(?:json)?\s*([\s\S]*?)```", trimmed)
+    if code:
+        trimmed = code.group(1).strip()
+    start, end = trimmed.find("{"), trimmed.rfind("}") + 1
+    if start == -1 or end <= start:
+        return None, []
+    try:
+        data = json.loads(trimmed[start:end])
+    except ValueError:
+        return None, []
+    if not isinstance(data, dict):
+        return None, []
+    label = data.get("label")
+    if not isinstance(label, str) or not label.strip():
+        return None, []
+    products = data.get("products")
+    products = [p for p in products if _is_product(p)] if isinstance(products, list) else []
+    return label.strip(), products
+
+
 async def get_similar_products(api_key: str, description: str) -> list[dict]:
+    """
+    Product suggestions for a label; cached and coalesced by normalized label.
+    Returns [] when the request deadline leaves too little budget for the call.
+    """
+    budget = deadline.remaining()
+    if budget is not None and budget < PRODUCTS_MIN_BUDGET:
+        return product_cache.get(description) or []
+    try:
+        return await asyncio.wait_for(
+            product_cache.get_or_fetch(description, lambda: _fetch_similar_products(api_key, description)),
+            budget,
+        )
+    except asyncio.TimeoutError:
+        return []
+
+
+def _products_body(description: str) -> dict:
     prompt = (
         f'The user selected an image region described as: "{description}". '
         'Suggest 3 to 5 similar or related products that could be purchased online. '
@@ -64,27 +181,118 @@ async def get_similar_products(api_key: str, description: str) -> list[dict]:
         'Reply with ONLY a valid JSON array of objects with keys "name" and "search_query". '
         'Example: [{"name": "Wireless Mouse", "search_query": "wireless bluetooth mouse"}]'
     )
-    body = {
+    return {
         "model": DEDALUS_VISION_MODEL,
         "max_tokens": 500,
         "messages": [{"role": "user", "content": prompt}],
     }
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            DEDALUS_API,
-            json=body,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-            },
-            timeout=30.0,
-        )
+
+
+def _is_product(p) -> bool:
+    return isinstance(p, dict) and isinstance(p.get("name"), str) and isinstance(p.get("search_query"), str)
+
+
+async def _fetch_similar_products(api_key: str, description: str) -> list[dict]:
+    try:
+        with timing.span("products"):
+            r = await _post_chat(api_key, _products_body(description))
+    except (UpstreamUnavailable, DeadlineExceeded, httpx.HTTPError):
+        return []  # degrade to a description-only result
     if r.status_code != 200:
         return []
-    data = r.json()
-    raw = (data.get("choices") or [{}])[0].get("message", {}).get("content") or ""
-    parsed = _parse_similar_products(raw)
-    return [p for p in parsed if isinstance(p.get("name"), str) and isinstance(p.get("search_query"), str)]
+    with timing.span("parse"):
+        data = r.json()
+        raw = (data.get("choices") or [{}])[0].get("message", {}).get("content") or ""
+        parsed = _parse_similar_products(raw)
+        return [p for p in parsed if _is_product(p)]
+
+
+async def stream_similar_products(api_key: str, description: str) -> AsyncIterator[dict]:
+    """Yield products one by one as their JSON objects complete in a streamed completion."""
+    body = _products_body(description)
+    body["stream"] = True
+    parser = _ProductStreamParser()
+    client = upstream.get_client()
+    request = client.build_request("POST", DEDALUS_API, json=body, headers=_headers(api_key))
+    async with guard.admit():
+        started = time.monotonic()
+        try:
+            with timing.span("products_first_byte"):
+                r = await deadline.bounded(client.send(request, stream=True), UPSTREAM_TIMEOUT)
+        except DeadlineExceeded:
+            guard.record_timeout(time.monotonic() - started)
+            raise
+        except httpx.TransportError:
+            guard.record_failure()
+            raise
+        try:
+            guard.record_response(r, time.monotonic() - started)
+            if r.status_code != 200:
+                return
+            async for p in _iter_stream_products(r, parser):
+                yield p
+        finally:
+            await r.aclose()
+
+
+async def _iter_stream_products(r: httpx.Response, parser: "_ProductStreamParser") -> AsyncIterator[dict]:
+    lines = r.aiter_lines()
+    while True:
+        try:
+            line = await deadline.bounded(lines.__anext__(), UPSTREAM_TIMEOUT)
+        except StopAsyncIteration:
+            break
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content") or ""
+        for p in parser.feed(delta):
+            yield p
+
+
+class _ProductStreamParser:
+    """Incrementally extracts complete top-level {...} objects from streamed JSON-array text."""
+
+    def __init__(self):
+        self._buf: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> list[dict]:
+        out = []
+        for ch in text:
+            if self._depth:
+                self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._depth > 0
+            elif ch == "{":
+                if not self._depth:
+                    self._buf = [ch]
+                self._depth += 1
+            elif ch == "}" and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    try:
+                        obj = json.loads("".join(self._buf))
+                    except ValueError:
+                        obj = None
+                    if _is_product(obj):
+                        out.append(obj)
+        return out
 
 
 def _parse_similar_products(text: str) -> list:
@@ -105,14 +313,98 @@ def _parse_similar_products(text: str) -> list:
         return []
 
 
-async def analyze(body: AnalyzeRequest, user_id: str | None, api_key: str) -> dict:
+def _require_api_key(api_key: str) -> None:
     if not api_key:
         raise HTTPException(status_code=500, detail="DEDALUS_API_KEY is not set on the server")
+
+
+async def analyze(body: AnalyzeRequest, user_id: str | None, api_key: str) -> dict:
+    _require_api_key(api_key)
+    with timing.span("image"):
+        image = await imaging.prepare(body.image, body.mimeType or "image/png")
+    return await analyze_prepared(image, user_id, api_key, body.mode)
+
+
+class _Latency:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, started: float) -> None:
+        ms = (time.perf_counter() - started) * 1000
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+# Upstream latency per path; "combined_fallback" is a combined attempt that fell back to two_step.
+mode_latency = {"two_step": _Latency(), "combined": _Latency(), "combined_fallback": _Latency()}
+
+
+def mode_stats() -> dict:
+    return {"default": ANALYZE_MODE, **{k: v.stats() for k, v in mode_latency.items()}}
+
+
+async def analyze_prepared(
+    image: imaging.PreparedImage,
+    user_id: str | None,
+    api_key: str,
+    mode: Optional[str] = None,
+) -> dict:
+    phash = image.phash
+    if phash is not None:
+        with timing.span("cache"):
+            cached = result_cache.get(phash)
+        if cached is not None:
+            return _build_result(*cached)
+    mode = mode or ANALYZE_MODE
+    started = time.perf_counter()
+    description = None
     try:
-        description = await call_dedalus_vision(api_key, body.image, body.mimeType or "image/png")
+        if mode == "combined":
+            description, similar_products = await call_dedalus_combined(api_key, image.base64, image.mime_type)
+            if description is not None:
+                if similar_products:
+                    product_cache.put(description, similar_products)
+                else:
+                    similar_products = await get_similar_products(api_key, description)
+                mode_latency["combined"].record(started)
+        if description is None:
+            description = await call_dedalus_vision(api_key, image.base64, image.mime_type)
+            similar_products = await get_similar_products(api_key, description)
+            mode_latency["combined_fallback" if mode == "combined" else "two_step"].record(started)
     except ValueError as e:
         raise HTTPException(status_code=502, detail=str(e))
-    similar_products = await get_similar_products(api_key, description)
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
+    except (DeadlineExceeded, httpx.TimeoutException):
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=str(e) or type(e).__name__)
+    # Don't pin a degraded (empty) product list in the cache.
+    if phash is not None and similar_products:
+        result_cache.put(phash, (description, similar_products))
+    return _build_result(description, similar_products)
+
+
+def _unavailable(e: UpstreamUnavailable) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=e.detail,
+        headers={"Retry-After": str(max(1, round(e.retry_after)))},
+    )
+
+
+def _build_result(description: str, similar_products: list[dict]) -> dict:
+    similar_products = [dict(p) for p in similar_products]
     return {
         "description": description,
         "similarProducts": similar_products,
@@ -121,3 +413,198 @@ async def analyze(body: AnalyzeRequest, user_id: str | None, api_key: str) -> di
             for p in similar_products
         ],
     }
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def analyze_stream(body: AnalyzeRequest, user_id: str | None, api_key: str) -> AsyncIterator[str]:
+    """
+    Server-Sent Events variant of analyze(): emits `description` as soon as the vision call
+    returns, then one `product` event per suggestion as it is parsed, then `done` with the
+    full result (same shape as /analyze). Upstream failures become an `error` event.
+    """
+    with timing.span("image"):
+        image = await imaging.prepare(body.image, body.mimeType or "image/png")
+    async for event in analyze_prepared_stream(image, user_id, api_key):
+        yield event
+
+
+async def analyze_prepared_stream(image: imaging.PreparedImage, user_id: str | None, api_key: str) -> AsyncIterator[str]:
+    phash = image.phash
+    cached = result_cache.get(phash) if phash is not None else None
+    if cached is not None:
+        description, products = cached
+        yield _sse("description", {"description": description})
+        for p in products:
+            yield _sse("product", p)
+        yield _sse("done", _build_result(description, products))
+        return
+    try:
+        description = await call_dedalus_vision(api_key, image.base64, image.mime_type)
+    except (DeadlineExceeded, httpx.TimeoutException):
+        yield _sse("error", {"status": 504, "detail": "Request deadline exceeded"})
+        return
+    except (ValueError, httpx.HTTPError) as e:
+        yield _sse("error", {"status": 502, "detail": str(e)})
+        return
+    except UpstreamUnavailable as e:
+        yield _sse("error", {"status": 503, "detail": e.detail, "retryAfter": round(e.retry_after, 1)})
+        return
+    yield _sse("description", {"description": description})
+    products = product_cache.get(description)
+    budget = deadline.remaining()
+    if products is not None:
+        for p in products:
+            yield _sse("product", p)
+    elif budget is not None and budget < PRODUCTS_MIN_BUDGET:
+        products = []  # not enough budget left; finish with the description alone
+    else:
+        products = []
+        try:
+            async for p in stream_similar_products(api_key, description):
+                products.append(p)
+                yield _sse("product", p)
+        except (httpx.HTTPError, UpstreamUnavailable, DeadlineExceeded):
+            pass  # headers are already sent; finish with what we have
+        if products:
+            product_cache.put(description, products)
+    if phash is not None and products:
+        result_cache.put(phash, (description, products))
+    yield _sse("done", _build_result(description, products))
+
+
+def _event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def analyze_stream_response(body: AnalyzeRequest, user_id: str | None, api_key: str) -> StreamingResponse:
+    _require_api_key(api_key)
+    return _event_stream(analyze_stream(body, user_id, api_key))
+
+
+async def read_image_upload(request: Request) -> tuple[bytes, str]:
+    """
+    Read a binary image upload without base64: either multipart/form-data with an `image`
+    file part, or a raw body (image/* or application/octet-stream, type in X-Image-Type).
+    """
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_UPLOAD_BYTES} bytes")
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        part = form.get("image")
+        if part is None or isinstance(part, str):
+            raise HTTPException(status_code=400, detail="Missing `image` file part")
+        raw = await part.read()
+        mime_type = part.content_type or "image/png"
+    else:
+        raw = await request.body()
+        if content_type.startswith("image/"):
+            mime_type = content_type.split(";")[0].strip()
+        else:
+            mime_type = request.headers.get("x-image-type", "image/png")
+    if not raw:
+        raise HTTPException(status_code=400, detail="Empty image")
+    if len(raw) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_UPLOAD_BYTES} bytes")
+    return raw, mime_type
+
+
+async def analyze_upload(
+    request: Request,
+    user_id: str | None,
+    api_key: str,
+    stream: bool = False,
+    mode: Optional[str] = None,
+):
+    _require_api_key(api_key)
+    if mode not in (None, "two_step", "combined"):
+        raise HTTPException(status_code=400, detail="mode must be 'two_step' or 'combined'")
+    with timing.span("upload"):
+        raw, mime_type = await read_image_upload(request)
+    with timing.span("image"):
+        image = await imaging.prepare_raw(raw, mime_type)
+    if stream:
+        return _event_stream(analyze_prepared_stream(image, user_id, api_key))
+    return await analyze_prepared(image, user_id, api_key, mode)
+
+
+def check_batch(body: AnalyzeBatchRequest, api_key: str) -> None:
+    """Reject an unusable batch; the endpoint calls this before charging the rate limiter."""
+    _require_api_key(api_key)
+    if not body.items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(body.items) > ANALYZE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {ANALYZE_BATCH_MAX_ITEMS} items")
+
+
+def batch_deadline(body: AnalyzeBatchRequest) -> float:
+    """Whole-batch budget: ANALYZE_DEADLINE for each wave of ANALYZE_BATCH_CONCURRENCY unique images."""
+    unique = len({(item.image, item.mimeType) for item in body.items})
+    return ANALYZE_DEADLINE * math.ceil(unique / max(1, ANALYZE_BATCH_CONCURRENCY))
+
+
+async def _analyze_one(item: AnalyzeRequest, user_id: str | None, api_key: str) -> dict:
+    async with _batch_semaphore:
+        # the item's own budget starts when it gets a slot, but never outlives the batch deadline
+        left = deadline.remaining()
+        deadline.start(ANALYZE_DEADLINE if left is None else min(ANALYZE_DEADLINE, left))
+        try:
+            return {"status": 200, "result": await analyze(item, user_id, api_key)}
+        except HTTPException as e:
+            return {"status": e.status_code, "error": e.detail}
+        except httpx.HTTPError as e:
+            return {"status": 502, "error": str(e) or type(e).__name__}
+
+
+async def _run_batch(body: AnalyzeBatchRequest, user_id: str | None, api_key: str) -> AsyncIterator[tuple[list[int], dict]]:
+    """Yield (indices, outcome) as each unique image finishes; identical images run once."""
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i, item in enumerate(body.items):
+        groups.setdefault((item.image, item.mimeType), []).append(i)
+    pending = {
+        asyncio.ensure_future(_analyze_one(body.items[indices[0]], user_id, api_key)): indices
+        for indices in groups.values()
+    }
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                yield pending.pop(fut), fut.result()
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+async def analyze_batch(body: AnalyzeBatchRequest, user_id: str | None, api_key: str) -> dict:
+    results: list[dict | None] = [None] * len(body.items)
+    unique = 0
+    async for indices, outcome in _run_batch(body, user_id, api_key):
+        unique += 1
+        for i in indices:
+            results[i] = {"index": i, **outcome}
+    return {"results": results, "unique": unique}
+
+
+async def analyze_batch_stream(body: AnalyzeBatchRequest, user_id: str | None, api_key: str) -> AsyncIterator[str]:
+    """SSE: one `item` event per batch entry as it finishes, then `done` with counts."""
+    ok = failed = 0
+    async for indices, outcome in _run_batch(body, user_id, api_key):
+        for i in indices:
+            if outcome["status"] == 200:
+                ok += 1
+            else:
+                failed += 1
+            yield _sse("item", {"index": i, **outcome})
+    yield _sse("done", {"total": len(body.items), "ok": ok, "failed": failed})
+
+
+def analyze_batch_stream_response(body: AnalyzeBatchRequest, user_id: str | None, api_key: str) -> StreamingResponse:
+    return _event_stream(analyze_batch_stream(body, user_id, api_key))
@@ -1,13 +1,49 @@
 """
-In-memory store for saved items and boards (MVP). Replace with DB (e.g. Supabase) for production.
+Saved items and boards. Persistence goes through storage.ItemStore
+(in-memory by default, SQLite with ITEMS_BACKEND=sqlite).
+
+Images sent inline in item metadata (a data: URL or bare base64 under INLINE_IMAGE_KEYS) are
+moved out of the item on save: the original becomes a blob served by GET /items/{id}/image,
+thumbnails are rendered in the background, and the metadata keeps only those references.
 """
+import asyncio
+import base64
+import binascii
+import logging
+import time
 import uuid
-from pydantic import BaseModel
-from typing import Any, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, Any, Literal, Optional, Union
+
+from changefeed import ChangeFeed
+import thumbnails
+import timing
+from config import (
+    CHANGEFEED_PING_INTERVAL,
+    CHANGEFEED_POLL_INTERVAL,
+    CHANGEFEED_QUEUE_SIZE,
+    CHANGEFEED_RETENTION,
+    IDEMPOTENCY_TTL,
+)
+import idempotency
+from idempotency import IdempotencyConflict, fingerprint
+from storage import ITEM_FIELDS, InvalidCursor, get_store
+
+
+logger = logging.getLogger(__name__)
+
+# metadata keys whose inline image is moved into the item's blobs on save
+INLINE_IMAGE_KEYS = ("image", "thumbnail")
 
-_store: dict[str, list[dict]] = {}
-_boards: dict[str, list[dict]] = {}
-DEFAULT_BOARD_NAME = "Saved"
+feed = ChangeFeed(
+    queue_size=CHANGEFEED_QUEUE_SIZE,
+    ping_interval=CHANGEFEED_PING_INTERVAL,
+    poll_interval=CHANGEFEED_POLL_INTERVAL,
+    retention=CHANGEFEED_RETENTION,
+)
+_thumbnail_jobs: set[asyncio.Task] = set()
 
 
 class SaveItemRequest(BaseModel):
@@ -27,27 +63,38 @@ class MoveItemRequest(BaseModel):
     board_id: str
 
 
-def _ensure_user(user_id: str) -> None:
-    if user_id not in _store:
-        _store[user_id] = []
-    if user_id not in _boards:
-        _boards[user_id] = []
+class BulkSaveOp(BaseModel):
+    op: Literal["save"]
+    item: SaveItemRequest
+
+
+class BulkMoveOp(BaseModel):
+    op: Literal["move"]
+    id: str
+    board_id: str
+
+
+class BulkDeleteOp(BaseModel):
+    op: Literal["delete"]
+    id: str
 
 
-def _get_or_create_default_board(user_id: str) -> str:
-    _ensure_user(user_id)
-    boards = _boards[user_id]
-    if not boards:
-        board_id = str(uuid.uuid4())
-        boards.append({"id": board_id, "name": DEFAULT_BOARD_NAME})
-        return board_id
-    return boards[0]["id"]
+class BulkMoveAllOp(BaseModel):
+    """Move every item of one board to another."""
+    op: Literal["move_all"]
+    from_board_id: str
+    to_board_id: str
 
 
-async def save_item(body: SaveItemRequest, user_id: str) -> dict:
-    _ensure_user(user_id)
-    board_id = body.board_id or _get_or_create_default_board(user_id)
-    item = {
+BulkOp = Annotated[Union[BulkSaveOp, BulkMoveOp, BulkDeleteOp, BulkMoveAllOp], Field(discriminator="op")]
+
+
+class BulkRequest(BaseModel):
+    ops: list[BulkOp]
+
+
+def _new_item(body: SaveItemRequest, board_id: str) -> dict:
+    return {
         "id": str(uuid.uuid4()),
         "type": body.type,
         "title": body.title,
@@ -55,62 +102,252 @@ async def save_item(body: SaveItemRequest, user_id: str) -> dict:
         "metadata": body.metadata,
         "source_url": body.source_url,
         "board_id": board_id,
+        "created_at": time.time(),
     }
-    _store[user_id].append(item)
-    return {"id": item["id"], "board_id": board_id}
 
 
-async def list_items(user_id: str, board_id: Optional[str] = None) -> dict:
-    _ensure_user(user_id)
-    default_id = _get_or_create_default_board(user_id)
-    items = []
-    for i in _store[user_id]:
-        if "board_id" not in i:
-            i["board_id"] = default_id
-        items.append(i)
-    if board_id:
-        items = [i for i in items if i.get("board_id") == board_id]
-    return {"items": items}
+def _inline_image(value: Any) -> Optional[tuple[bytes, str]]:
+    """(bytes, mime) of a data: URL or bare base64 image; None for URLs, text and non-images."""
+    if not isinstance(value, str):
+        return None
+    mime = None
+    if value.startswith("data:"):
+        header, sep, value = value.partition(",")
+        if not sep or not header.endswith(";base64"):
+            return None
+        mime = header[5:-7] or None
+    elif len(value) < 256 or value.startswith(("http://", "https://")):
+        return None
+    try:
+        data = base64.b64decode(value, validate=True)
+    except binascii.Error:
+        return None
+    mime = mime or thumbnails.sniff_mime(data)
+    return (data, mime) if mime else None
+
+
+def _extract_inline_image(item: dict) -> Optional[tuple[bytes, str]]:
+    """
+    Replace the first inline image in the item's metadata by a reference to the stored original
+    and add thumbnail_url (a board cover key). Returns the image as (bytes, mime), if any.
+    """
+    metadata = item["metadata"]
+    for key in INLINE_IMAGE_KEYS:
+        image = _inline_image(metadata.get(key))
+        if image is not None:
+            base = f"/items/{item['id']}"
+            item["metadata"] = {
+                **metadata,
+                key: f"{base}/thumbnail" if key == "thumbnail" else f"{base}/image",
+                "thumbnail_url": f"{base}/thumbnail",
+            }
+            return image
+    return None
+
+
+async def _store_image(store, user_id: str, item_id: str, image: tuple[bytes, str]) -> None:
+    """Store the original now; render and store the thumbnails in the background."""
+    with timing.span("store_write"):
+        await store.put_blobs(user_id, item_id, {"original": image})
+    if thumbnails.available():
+        task = asyncio.create_task(_store_thumbnails(store, user_id, item_id, image[0]))
+        _thumbnail_jobs.add(task)
+        task.add_done_callback(_thumbnail_jobs.discard)
+
+
+async def _store_thumbnails(store, user_id: str, item_id: str, raw: bytes) -> None:
+    try:
+        rendered = await thumbnails.render(raw)
+        if rendered:
+            await store.put_blobs(user_id, item_id, {f"thumb_{size}": thumb for size, thumb in rendered.items()})
+    except Exception as e:  # the original is still served in place of the thumbnail
+        logger.warning("thumbnails for item %s not stored: %r", item_id, e)
+
+
+async def _default_board(store, user_id: str) -> str:
+    with timing.span("store_read"):
+        return await store.default_board(user_id)
+
+
+async def save_item(body: SaveItemRequest, user_id: str, idempotency_key: Optional[str] = None) -> tuple[dict, bool]:
+    """
+    Save one item; returns (response, replayed). A repeated Idempotency-Key with the same
+    body replays the first response instead of writing again; with a different body, 422.
+    """
+    store = get_store()
+    board_id = body.board_id or await _default_board(store, user_id)
+    item = _new_item(body, board_id)
+    image = _extract_inline_image(item)
+    with timing.span("store_write"):
+        if not idempotency_key:
+            await store.add_item(user_id, item)
+        else:
+            try:
+                response, replayed = await store.add_item_once(
+                    user_id, item, idempotency_key, fingerprint(body.model_dump_json()), IDEMPOTENCY_TTL
+                )
+            except IdempotencyConflict:
+                idempotency.record_conflict()
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different payload")
+            if replayed:
+                idempotency.record_replay()
+                return response, True
+    if image:
+        await _store_image(store, user_id, item["id"], image)
+    await feed.publish(user_id, "item.saved", item=item)
+    return {"id": item["id"], "board_id": board_id}, False
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[set[str]]:
+    """`fields=id,title,board_id` -> projection set (id is always included)."""
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(ITEM_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return wanted | {"id"}
+
+
+async def list_items(
+    user_id: str,
+    board_id: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> dict:
+    """
+    Items in save order: one keyset page of `limit` items and `next_cursor` (pass it back as
+    `cursor`; None on the last page). limit=None returns the whole collection.
+    """
+    store = get_store()
+    await _default_board(store, user_id)
+    try:
+        with timing.span("store_read"):
+            page, next_cursor = await store.list_items(user_id, board_id, limit, cursor, _parse_fields(fields))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": page, "next_cursor": next_cursor}
+
+
+async def get_image(item_id: str, user_id: str) -> Optional[tuple[bytes, str]]:
+    """The original of an image moved out of the item's metadata on save."""
+    with timing.span("store_read"):
+        return await get_store().get_blob(user_id, item_id, "original")
+
+
+async def get_thumbnail(item_id: str, user_id: str, size: Optional[int] = None) -> Optional[tuple[bytes, str, bool]]:
+    """(data, mime, is_thumbnail): the original stands in until the thumbnail has been rendered."""
+    store = get_store()
+    with timing.span("store_read"):
+        if thumbnails.available():
+            thumb = await store.get_blob(user_id, item_id, f"thumb_{thumbnails.pick_size(size)}")
+            if thumb:
+                return thumb[0], thumb[1], True
+        original = await store.get_blob(user_id, item_id, "original")
+    return (original[0], original[1], False) if original else None
 
 
 async def delete_item(item_id: str, user_id: str) -> bool:
-    _ensure_user(user_id)
-    orig_len = len(_store[user_id])
-    _store[user_id] = [i for i in _store[user_id] if i["id"] != item_id]
-    return len(_store[user_id]) < orig_len
+    with timing.span("store_write"):
+        ok = await get_store().delete_item(user_id, item_id)
+    if ok:
+        await feed.publish(user_id, "item.deleted", id=item_id)
+    return ok
 
 
 async def move_item_to_board(item_id: str, board_id: str, user_id: str) -> bool:
-    _ensure_user(user_id)
-    for item in _store[user_id]:
-        if item["id"] == item_id:
-            item["board_id"] = board_id
-            return True
-    return False
+    with timing.span("store_write"):
+        ok = await get_store().move_item(user_id, item_id, board_id)
+    if ok:
+        await feed.publish(user_id, "item.moved", id=item_id, board_id=board_id)
+    return ok
 
 
-async def list_boards(user_id: str) -> dict:
-    _ensure_user(user_id)
-    if not _boards[user_id]:
-        _get_or_create_default_board(user_id)
-    return {"boards": _boards[user_id]}
+async def list_boards(user_id: str, summary: bool = False) -> dict:
+    """Boards; with summary, each carries item_count, latest_at and a cover reference."""
+    store = get_store()
+    await _default_board(store, user_id)
+    with timing.span("store_read"):
+        boards = await store.list_boards(user_id, summary)
+    return {"boards": boards}
 
 
 async def create_board(body: CreateBoardRequest, user_id: str) -> dict:
-    _ensure_user(user_id)
     board_id = str(uuid.uuid4())
     name = body.name.strip() or "Untitled"
-    _boards[user_id].append({"id": board_id, "name": name})
+    with timing.span("store_write"):
+        await get_store().add_board(user_id, {"id": board_id, "name": name})
+    await feed.publish(user_id, "board.created", id=board_id, name=name)
     return {"id": board_id, "name": name}
 
 
 async def delete_board(board_id: str, user_id: str) -> dict:
-    _ensure_user(user_id)
-    default_id = _get_or_create_default_board(user_id)
+    store = get_store()
+    default_id = await _default_board(store, user_id)
     if board_id == default_id:
         return {"status": "cannot_delete_default"}
-    _boards[user_id] = [b for b in _boards[user_id] if b["id"] != board_id]
-    for item in _store[user_id]:
-        if item.get("board_id") == board_id:
-            item["board_id"] = default_id
+    with timing.span("store_write"):
+        await store.delete_board(user_id, board_id, default_id)
+    # its items now live on the default board; clients reassign them locally
+    await feed.publish(user_id, "board.deleted", id=board_id, moved_to=default_id)
     return {"status": "deleted"}
+
+
+async def bulk(body: BulkRequest, user_id: str) -> dict:
+    """Apply save/move/delete/move_all ops in order, in one store call; one result per op."""
+    store = get_store()
+    default_id = await _default_board(store, user_id)
+    ops: list[tuple] = []
+    images: dict[str, tuple[bytes, str]] = {}
+    for op in body.ops:
+        if isinstance(op, BulkSaveOp):
+            item = _new_item(op.item, op.item.board_id or default_id)
+            image = _extract_inline_image(item)
+            if image:
+                images[item["id"]] = image
+            ops.append(("add", item))
+        elif isinstance(op, BulkMoveOp):
+            ops.append(("move", op.id, op.board_id))
+        elif isinstance(op, BulkDeleteOp):
+            ops.append(("delete", op.id))
+        else:
+            ops.append(("move_all", op.from_board_id, op.to_board_id))
+    with timing.span("store_write"):
+        outcomes = await store.bulk(user_id, ops)
+    results = []
+    for i, (op, store_op, outcome) in enumerate(zip(body.ops, ops, outcomes)):
+        result = {"index": i, "op": op.op, **outcome}
+        if store_op[0] == "add":
+            result.update(id=store_op[1]["id"], board_id=store_op[1]["board_id"])
+        elif store_op[0] in ("move", "delete"):
+            result["id"] = store_op[1]
+            if not outcome["ok"]:
+                result["error"] = "Item not found"
+        results.append(result)
+        if outcome["ok"]:
+            if store_op[0] == "add" and store_op[1]["id"] in images:
+                await _store_image(store, user_id, store_op[1]["id"], images[store_op[1]["id"]])
+            await _publish_op(user_id, store_op)
+    return {"results": results}
+
+
+async def _publish_op(user_id: str, store_op: tuple) -> None:
+    kind = store_op[0]
+    if kind == "add":
+        await feed.publish(user_id, "item.saved", item=store_op[1])
+    elif kind == "move":
+        await feed.publish(user_id, "item.moved", id=store_op[1], board_id=store_op[2])
+    elif kind == "delete":
+        await feed.publish(user_id, "item.deleted", id=store_op[1])
+    else:
+        await feed.publish(user_id, "board.items_moved", from_board_id=store_op[1], to_board_id=store_op[2])
+
+
+def events_response(user_id: str) -> StreamingResponse:
+    """SSE stream of this user's item/board changes (see changefeed.py for event shapes)."""
+    return StreamingResponse(
+        feed.stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
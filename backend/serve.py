@@ -0,0 +1,108 @@
+"""
+Production launcher for the backend:
+
+    python serve.py                       # one worker per available CPU (see --workers)
+    python serve.py --workers 4 --max-requests 5000
+    python serve.py --reload              # development
+
+- pre-forked uvicorn workers sharing one listening socket
+- uvloop event loop and httptools parser when installed (uvicorn[standard])
+- each worker runs the app lifespan (pooled upstream client, --prewarm connections, item store
+  connections) before it accepts a connection
+- SIGTERM: workers stop accepting and let in-flight requests finish; /analyze is bounded by
+  ANALYZE_DEADLINE, so the default --graceful-timeout covers it. Streams still open after
+  that (the /items/events change feed) are cancelled and clients reconnect.
+- with more than one worker, each exits after --max-requests (plus random jitter, so workers
+  don't recycle together) and the supervisor starts a fresh one. A single worker has no
+  supervisor (it would just stop), and recycling a worker of the in-memory item store would
+  drop its items, so --max-requests is ignored in both cases.
+"""
+import argparse
+import importlib.util
+import inspect
+import logging
+import os
+
+import uvicorn
+
+import config
+from config import ANALYZE_DEADLINE, HOST, ITEMS_BACKEND, PORT, RATE_LIMIT_BACKEND
+
+logger = logging.getLogger("serve")
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY if set; else one per CPU, or 1 while state is per-process (memory backends)."""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    if ITEMS_BACKEND == "memory":
+        return 1
+    return available_cpus()
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Lens Capture API with production settings.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="default: WEB_CONCURRENCY or available CPUs")
+    parser.add_argument(
+        "--max-requests", type=int, default=10000,
+        help="recycle a worker after this many requests (0: never; multi-worker, non-memory backends only)",
+    )
+    parser.add_argument("--max-requests-jitter", type=int, default=None, help="default: 10%% of --max-requests")
+    parser.add_argument("--graceful-timeout", type=float, default=ANALYZE_DEADLINE + 5, help="seconds to drain on SIGTERM")
+    parser.add_argument("--prewarm", type=int, default=2, help="upstream connections to open per worker at startup")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--reload", action="store_true", help="development: single process, restart on code changes")
+    args = parser.parse_args(argv)
+
+    workers = 1 if args.reload else (args.workers or default_workers())
+    if workers > 1 and (ITEMS_BACKEND == "memory" or RATE_LIMIT_BACKEND == "memory"):
+        logger.warning(
+            "%d workers with ITEMS_BACKEND=%s RATE_LIMIT_BACKEND=%s: in-memory state is not shared between workers",
+            workers, ITEMS_BACKEND, RATE_LIMIT_BACKEND,
+        )
+    # spawned workers import config afresh from the environment; a single-process server imports
+    # main into this process, where config has already been read, so update the module too
+    os.environ["UPSTREAM_PREWARM"] = str(args.prewarm)
+    config.UPSTREAM_PREWARM = args.prewarm
+
+    max_requests = args.max_requests or None
+    if max_requests and (workers == 1 or ITEMS_BACKEND == "memory"):
+        logger.info("--max-requests ignored: no worker recycling with %d worker(s) and ITEMS_BACKEND=%s",
+                    workers, ITEMS_BACKEND)
+        max_requests = None
+    jitter = args.max_requests_jitter if args.max_requests_jitter is not None else (args.max_requests or 0) // 10
+    options = {}
+    if max_requests and jitter and "limit_max_requests_jitter" in inspect.signature(uvicorn.Config).parameters:
+        options["limit_max_requests_jitter"] = jitter  # not available in older uvicorn releases
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="uvloop" if _installed("uvloop") else "auto",
+        http="httptools" if _installed("httptools") else "auto",
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        reload=args.reload,
+        log_level=args.log_level,
+        proxy_headers=True,
+        **options,
+    )
+
+
+if __name__ == "__main__":
+    main()
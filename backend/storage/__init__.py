@@ -0,0 +1,32 @@
+"""
+Pluggable storage for saved items and boards.
+ITEMS_BACKEND selects the implementation; routes/items.py only talks to ItemStore.
+"""
+from config import IDEMPOTENCY_MAX_KEYS, ITEMS_BACKEND, ITEMS_DB_PATH, ITEMS_DB_THREADS
+from storage.base import DEFAULT_BOARD_NAME, ITEM_FIELDS, InvalidCursor, ItemStore
+
+_store: ItemStore | None = None
+
+
+def get_store() -> ItemStore:
+    global _store
+    if _store is None:
+        if ITEMS_BACKEND == "sqlite":
+            from storage.sqlite import SQLiteItemStore
+            _store = SQLiteItemStore(ITEMS_DB_PATH, threads=ITEMS_DB_THREADS)
+        elif ITEMS_BACKEND == "memory":
+            from storage.memory import MemoryItemStore
+            _store = MemoryItemStore(idempotency_max_keys=IDEMPOTENCY_MAX_KEYS)
+        else:
+            raise ValueError(f"Unknown ITEMS_BACKEND: {ITEMS_BACKEND}")
+    return _store
+
+
+async def close_store() -> None:
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
+
+
+__all__ = ["DEFAULT_BOARD_NAME", "ITEM_FIELDS", "InvalidCursor", "ItemStore", "close_store", "get_store"]
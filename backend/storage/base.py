@@ -0,0 +1,151 @@
+"""
+Storage interface for items and boards. Items are plain dicts with keys
+id, type, title, description, metadata, source_url, board_id, created_at (epoch seconds).
+Binary payloads (an item's original image and its thumbnails) are named blobs of the item,
+stored outside the item dict and deleted with it.
+"""
+import base64
+import binascii
+from abc import ABC, abstractmethod
+from typing import Optional
+
+DEFAULT_BOARD_NAME = "Saved"
+ITEM_FIELDS = ("id", "type", "title", "description", "metadata", "source_url", "board_id", "created_at")
+# metadata keys that may hold an image reference for a board cover, in order of preference
+COVER_KEYS = ("thumbnail", "thumbnail_url", "image_url")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(seq: Optional[int]) -> Optional[str]:
+    """Opaque keyset cursor for the last returned item's save sequence."""
+    if seq is None:
+        return None
+    return base64.urlsafe_b64encode(str(seq).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def project(item: dict, fields: Optional[set[str]]) -> dict:
+    if fields is None:
+        return item
+    return {k: v for k, v in item.items() if k in fields}
+
+
+def board_summary(board: dict, count: int, latest: Optional[dict]) -> dict:
+    """Board plus item_count, latest_at and a cover reference taken from its newest item."""
+    cover = None
+    if latest is not None:
+        metadata = latest.get("metadata") or {}
+        image = next((metadata[k] for k in COVER_KEYS if isinstance(metadata.get(k), str) and metadata[k]), None)
+        cover = {"item_id": latest["id"], "image": image}
+    return {
+        **board,
+        "item_count": count,
+        "latest_at": (latest.get("created_at") or None) if latest is not None else None,
+        "cover": cover,
+    }
+
+
+class ItemStore(ABC):
+    @abstractmethod
+    async def default_board(self, user_id: str) -> str:
+        """Id of the user's first board, creating the default board if they have none."""
+
+    @abstractmethod
+    async def add_item(self, user_id: str, item: dict) -> None: ...
+
+    @abstractmethod
+    async def add_item_once(
+        self, user_id: str, item: dict, key: str, request_fingerprint: str, ttl: float
+    ) -> tuple[dict, bool]:
+        """
+        add_item under an Idempotency-Key, atomically with recording the key. Returns
+        ({"id", "board_id"}, replayed): a repeat of (user_id, key) within ttl writes nothing and
+        returns the first save's ids, or raises IdempotencyConflict if request_fingerprint differs.
+        """
+
+    @abstractmethod
+    async def list_items(
+        self,
+        user_id: str,
+        board_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[set[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Items in save order, starting after cursor. Returns (items, next_cursor);
+        next_cursor is None on the last page. fields limits the keys returned.
+        """
+
+    @abstractmethod
+    async def delete_item(self, user_id: str, item_id: str) -> bool: ...
+
+    @abstractmethod
+    async def move_item(self, user_id: str, item_id: str, board_id: str) -> bool: ...
+
+    @abstractmethod
+    async def list_boards(self, user_id: str, summary: bool = False) -> list[dict]:
+        """
+        Boards in creation order. With summary, each also carries item_count, latest_at and
+        cover (see board_summary), read from aggregates kept current by every mutation.
+        """
+
+    @abstractmethod
+    async def add_board(self, user_id: str, board: dict) -> None: ...
+
+    @abstractmethod
+    async def delete_board(self, user_id: str, board_id: str, reassign_to: str) -> None:
+        """Remove a board and move its items to reassign_to."""
+
+    @abstractmethod
+    async def bulk(self, user_id: str, ops: list[tuple]) -> list[dict]:
+        """
+        Apply ops atomically (one lock hold / one transaction) and return one result per op.
+        Ops: ("add", item) | ("move", item_id, board_id) | ("delete", item_id)
+             | ("move_all", from_board_id, to_board_id)
+        """
+
+    @abstractmethod
+    async def put_blobs(self, user_id: str, item_id: str, blobs: dict[str, tuple[bytes, str]]) -> bool:
+        """Attach {name: (data, mime)} to an item, replacing same-named blobs; False if the item is gone."""
+
+    @abstractmethod
+    async def get_blob(self, user_id: str, item_id: str, name: str) -> Optional[tuple[bytes, str]]:
+        """(data, mime) of an item's blob, or None."""
+
+    # --- change log: set shared_changes when other processes can read the same store ---
+
+    shared_changes = False
+
+    async def append_change(self, user_id: str, event: str, data: str) -> int:
+        """Log one change event (data is encoded JSON); returns its sequence number."""
+        raise NotImplementedError
+
+    async def changes_after(self, seq: int, limit: int) -> list[tuple[int, str, str, str]]:
+        """Up to limit (seq, user_id, event, data) rows logged after seq, oldest first."""
+        raise NotImplementedError
+
+    async def last_change(self) -> int:
+        """Sequence number of the newest logged change (0 if none)."""
+        raise NotImplementedError
+
+    async def prune_changes(self, before: float) -> None:
+        """Drop changes logged before the given epoch time."""
+        raise NotImplementedError
+
+    async def prewarm(self) -> None:
+        """Open connections/caches before the worker takes traffic (default: nothing to do)."""
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,262 @@
+"""
+In-memory ItemStore (single process; data is lost on restart).
+"""
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+
+from idempotency import IdempotencyConflict
+from storage.base import DEFAULT_BOARD_NAME, ItemStore, board_summary, decode_cursor, encode_cursor, project
+
+
+class _SeqIndex:
+    """
+    Item ids sorted by save sequence, with lazy deletion. Seeking to a cursor is a bisect,
+    so a page costs O(log n + page size) instead of a scan from the start.
+    """
+
+    def __init__(self):
+        self.seqs: list[int] = []
+        self.ids: list[str] = []
+        self.dead = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.dead
+
+    def add(self, seq: int, item_id: str) -> None:
+        if not self.seqs or seq > self.seqs[-1]:
+            self.seqs.append(seq)
+            self.ids.append(item_id)
+            return
+        i = bisect_left(self.seqs, seq)
+        if i < len(self.seqs) and self.seqs[i] == seq:
+            self.dead = max(0, self.dead - 1)  # re-added (moved back); entry is live again
+            return
+        self.seqs.insert(i, seq)
+        self.ids.insert(i, item_id)
+
+    def discard(self, alive: Callable[[int, str], bool]) -> None:
+        self.dead += 1
+        if self.dead > 64 and self.dead * 2 > len(self.seqs):
+            keep = [(s, i) for s, i in zip(self.seqs, self.ids) if alive(s, i)]
+            self.seqs = [s for s, _ in keep]
+            self.ids = [i for _, i in keep]
+            self.dead = 0
+
+    def last(self, alive: Callable[[int, str], bool]) -> Optional[str]:
+        """Newest live id; dead entries at the tail are bounded by compaction."""
+        for k in range(len(self.seqs) - 1, -1, -1):
+            if alive(self.seqs[k], self.ids[k]):
+                return self.ids[k]
+        return None
+
+    def iter_after(self, after: Optional[int], alive: Callable[[int, str], bool]) -> Iterator[tuple[int, str]]:
+        start = 0 if after is None else bisect_right(self.seqs, after)
+        for k in range(start, len(self.seqs)):
+            seq, item_id = self.seqs[k], self.ids[k]
+            if alive(seq, item_id):
+                yield seq, item_id
+
+
+class _UserStore:
+    """
+    One user's items and boards, indexed so get/move/delete are O(1) and a board
+    listing only touches that board's items.
+    """
+
+    def __init__(self):
+        self.items: dict[str, dict] = {}  # item_id -> item, in save order
+        self.seq: dict[str, int] = {}  # item_id -> save sequence (cursor key)
+        self.next_seq = 1
+        self.all = _SeqIndex()
+        self.by_board: dict[str, _SeqIndex] = {}  # board_id -> item ids in save order
+        self.boards: dict[str, dict] = {}  # board_id -> board, in creation order (first is default)
+        self.blobs: dict[str, dict[str, tuple[bytes, str]]] = {}  # item_id -> name -> (data, mime)
+
+    def _alive(self, seq: int, item_id: str) -> bool:
+        return self.seq.get(item_id) == seq
+
+    def _alive_in(self, board_id: str) -> Callable[[int, str], bool]:
+        return lambda seq, item_id: self.seq.get(item_id) == seq and self.items[item_id]["board_id"] == board_id
+
+    def _board_index(self, board_id: str) -> _SeqIndex:
+        index = self.by_board.get(board_id)
+        if index is None:
+            index = self.by_board[board_id] = _SeqIndex()
+        return index
+
+    def add(self, item: dict) -> None:
+        seq = self.next_seq
+        self.next_seq += 1
+        # a copy: later moves must not rewrite the caller's dict (bulk reports and publishes it)
+        self.items[item["id"]] = dict(item)
+        self.seq[item["id"]] = seq
+        self.all.add(seq, item["id"])
+        self._board_index(item["board_id"]).add(seq, item["id"])
+
+    def remove(self, item_id: str) -> bool:
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return False
+        del self.seq[item_id]
+        self.blobs.pop(item_id, None)
+        self.all.discard(self._alive)
+        self._board_index(item["board_id"]).discard(self._alive_in(item["board_id"]))
+        return True
+
+    def move(self, item_id: str, board_id: str) -> bool:
+        item = self.items.get(item_id)
+        if item is None:
+            return False
+        old = item["board_id"]
+        if old != board_id:
+            item["board_id"] = board_id
+            self._board_index(old).discard(self._alive_in(old))
+            self._board_index(board_id).add(self.seq[item_id], item_id)
+        return True
+
+    def page(self, board_id: Optional[str], after: Optional[int], limit: Optional[int]) -> tuple[list[dict], Optional[int]]:
+        """Items after the given sequence, in save order; returns (items, last seq if more remain)."""
+        if board_id:
+            if board_id not in self.by_board:
+                return [], None
+            it = self.by_board[board_id].iter_after(after, self._alive_in(board_id))
+        else:
+            it = self.all.iter_after(after, self._alive)
+        out: list[dict] = []
+        last = None
+        for seq, item_id in it:
+            if limit is not None and len(out) == limit:
+                return out, last
+            out.append(self.items[item_id])
+            last = seq
+        return out, None
+
+    def reassign_board(self, from_board: str, to_board: str) -> int:
+        """Move every item of from_board to to_board; O(items in from_board). Returns the count."""
+        if from_board == to_board:
+            return 0
+        index = self.by_board.pop(from_board, None)
+        if index is None:
+            return 0
+        target = self._board_index(to_board)
+        moved = list(index.iter_after(None, self._alive_in(from_board)))
+        for seq, item_id in moved:
+            self.items[item_id]["board_id"] = to_board
+            target.add(seq, item_id)
+        return len(moved)
+
+    def summary(self, board: dict) -> dict:
+        """O(1) count (live entries of the board index) plus its newest item."""
+        index = self.by_board.get(board["id"])
+        if index is None:
+            return board_summary(board, 0, None)
+        latest = index.last(self._alive_in(board["id"]))
+        return board_summary(board, len(index), self.items[latest] if latest else None)
+
+
+class MemoryItemStore(ItemStore):
+    def __init__(self, idempotency_max_keys: int = 100_000):
+        self._users: dict[str, _UserStore] = {}
+        self.idempotency_max_keys = idempotency_max_keys
+        # (user, key) -> (expires_at, fingerprint, response); one TTL, so insertion order is expiry order
+        self._keys: OrderedDict[tuple[str, str], tuple[float, str, dict]] = OrderedDict()
+
+    def _user(self, user_id: str) -> _UserStore:
+        store = self._users.get(user_id)
+        if store is None:
+            store = self._users[user_id] = _UserStore()
+        return store
+
+    async def default_board(self, user_id: str) -> str:
+        store = self._user(user_id)
+        if not store.boards:
+            board_id = str(uuid.uuid4())
+            store.boards[board_id] = {"id": board_id, "name": DEFAULT_BOARD_NAME}
+            return board_id
+        return next(iter(store.boards))
+
+    async def add_item(self, user_id: str, item: dict) -> None:
+        self._user(user_id).add(item)
+
+    async def add_item_once(
+        self, user_id: str, item: dict, key: str, request_fingerprint: str, ttl: float
+    ) -> tuple[dict, bool]:
+        now = time.monotonic()
+        while self._keys:
+            expires_at = next(iter(self._keys.values()))[0]
+            if expires_at > now and len(self._keys) < self.idempotency_max_keys:
+                break
+            self._keys.popitem(last=False)
+        entry = self._keys.get((user_id, key))
+        if entry is not None:
+            _, stored_fingerprint, response = entry
+            if stored_fingerprint != request_fingerprint:
+                raise IdempotencyConflict(key)
+            return dict(response), True
+        self._user(user_id).add(item)
+        response = {"id": item["id"], "board_id": item["board_id"]}
+        self._keys[(user_id, key)] = (now + ttl, request_fingerprint, response)
+        return dict(response), False
+
+    async def list_items(
+        self,
+        user_id: str,
+        board_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[set[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        items, last = self._user(user_id).page(board_id, decode_cursor(cursor), limit)
+        return [project(i, fields) for i in items], encode_cursor(last)
+
+    async def delete_item(self, user_id: str, item_id: str) -> bool:
+        return self._user(user_id).remove(item_id)
+
+    async def move_item(self, user_id: str, item_id: str, board_id: str) -> bool:
+        return self._user(user_id).move(item_id, board_id)
+
+    async def list_boards(self, user_id: str, summary: bool = False) -> list[dict]:
+        store = self._user(user_id)
+        if summary:
+            return [store.summary(b) for b in store.boards.values()]
+        return list(store.boards.values())
+
+    async def add_board(self, user_id: str, board: dict) -> None:
+        self._user(user_id).boards[board["id"]] = board
+
+    async def delete_board(self, user_id: str, board_id: str, reassign_to: str) -> None:
+        store = self._user(user_id)
+        store.boards.pop(board_id, None)
+        store.reassign_board(board_id, reassign_to)
+
+    async def put_blobs(self, user_id: str, item_id: str, blobs: dict[str, tuple[bytes, str]]) -> bool:
+        store = self._user(user_id)
+        if item_id not in store.items:
+            return False
+        store.blobs.setdefault(item_id, {}).update(blobs)
+        return True
+
+    async def get_blob(self, user_id: str, item_id: str, name: str) -> Optional[tuple[bytes, str]]:
+        return self._user(user_id).blobs.get(item_id, {}).get(name)
+
+    async def bulk(self, user_id: str, ops: list[tuple]) -> list[dict]:
+        # No awaits inside: the whole batch runs in one event-loop step.
+        store = self._user(user_id)
+        results = []
+        for op in ops:
+            kind = op[0]
+            if kind == "add":
+                store.add(op[1])
+                results.append({"ok": True})
+            elif kind == "move":
+                results.append({"ok": store.move(op[1], op[2])})
+            elif kind == "delete":
+                results.append({"ok": store.remove(op[1])})
+            elif kind == "move_all":
+                results.append({"ok": True, "moved": store.reassign_board(op[1], op[2])})
+            else:
+                raise ValueError(f"Unknown bulk op: {kind}")
+        return results
@@ -0,0 +1,411 @@
+"""
+Durable SQLite ItemStore in WAL mode, safe to share between uvicorn workers.
+
+Queries run on a small thread pool (one connection per thread) so the event loop never
+blocks on disk; WAL lets readers proceed while another worker writes.
+
+Per-board aggregates (item_count, latest_seq) live on the boards row and are kept current
+by triggers, so every write path (including bulk and board reassignment) updates them in
+the same statement that changes items.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from idempotency import IdempotencyConflict
+from storage.base import DEFAULT_BOARD_NAME, ItemStore, board_summary, decode_cursor, encode_cursor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boards (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_boards_user ON boards(user_id, seq);
+CREATE TABLE IF NOT EXISTS items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    user_id TEXT NOT NULL,
+    board_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    metadata_json TEXT NOT NULL DEFAULT '{}',
+    source_url TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_items_user ON items(user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_items_user_board ON items(user_id, board_id, seq);
+CREATE TABLE IF NOT EXISTS item_blobs (
+    item_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mime TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (item_id, name)
+);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    board_id TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_expiry ON idempotency_keys(expires_at);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release: (table, column, definition)
+MIGRATIONS = (
+    ("items", "created_at", "REAL NOT NULL DEFAULT 0"),
+    ("boards", "item_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("boards", "latest_seq", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# latest_seq only needs a recompute (one index seek) when the newest item leaves the board
+_LEAVE_BOARD = """
+    UPDATE boards SET item_count = item_count - 1,
+        latest_seq = CASE WHEN latest_seq = OLD.seq THEN COALESCE(
+            (SELECT MAX(seq) FROM items WHERE user_id = OLD.user_id AND board_id = OLD.board_id), 0)
+            ELSE latest_seq END
+    WHERE id = OLD.board_id AND user_id = OLD.user_id;"""
+_JOIN_BOARD = """
+    UPDATE boards SET item_count = item_count + 1, latest_seq = MAX(latest_seq, NEW.seq)
+    WHERE id = NEW.board_id AND user_id = NEW.user_id;"""
+# (name, definition); a trigger whose stored SQL differs is dropped and recreated on startup
+TRIGGERS = (
+    ("items_board_agg_insert", f"AFTER INSERT ON items BEGIN{_JOIN_BOARD}\nEND"),
+    ("items_board_agg_delete", f"AFTER DELETE ON items BEGIN{_LEAVE_BOARD}\nEND"),
+    (
+        "items_board_agg_move",
+        f"AFTER UPDATE OF board_id ON items WHEN OLD.board_id != NEW.board_id BEGIN{_LEAVE_BOARD}{_JOIN_BOARD}\nEND",
+    ),
+    ("items_blobs_delete", "AFTER DELETE ON items BEGIN DELETE FROM item_blobs WHERE item_id = OLD.id; END"),
+)
+
+ITEM_COLUMNS = ("id", "type", "title", "description", "metadata", "source_url", "board_id", "created_at")
+
+
+def _select_columns(fields: Optional[set[str]]) -> str:
+    cols = [c for c in ITEM_COLUMNS if fields is None or c in fields]
+    return ", ".join("metadata_json" if c == "metadata" else c for c in cols) or "id"
+
+
+def _row_to_item(row: sqlite3.Row | dict) -> dict:
+    item = dict(row)
+    item.pop("seq", None)
+    if "metadata_json" in item:
+        try:
+            item["metadata"] = json.loads(item.pop("metadata_json") or "{}")
+        except (json.JSONDecodeError, TypeError):
+            item["metadata"] = {}
+    return item
+
+
+class SQLiteItemStore(ItemStore):
+    def __init__(self, path: str, threads: int = 4):
+        self.path = path
+        self._local = threading.local()
+        self._threads = max(1, threads)
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self._threads, thread_name_prefix="items-db")
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        self._write(conn, self._migrate)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        added = False
+        for table, column, definition in MIGRATIONS:
+            existing = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                added = added or table == "boards"
+        if added:
+            # one-time backfill of aggregates for databases created before they existed
+            conn.execute(
+                "UPDATE boards SET "
+                "item_count = (SELECT COUNT(*) FROM items i WHERE i.user_id = boards.user_id AND i.board_id = boards.id), "
+                "latest_seq = COALESCE((SELECT MAX(seq) FROM items i "
+                "WHERE i.user_id = boards.user_id AND i.board_id = boards.id), 0)"
+            )
+        existing = {r["name"]: r["sql"] for r in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")}
+        for name, definition in TRIGGERS:
+            sql = f"CREATE TRIGGER {name} {definition}"
+            if existing.get(name) != sql:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.execute(sql)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._conn()))
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run fn in one IMMEDIATE transaction (takes the write lock up front, no upgrade deadlocks)."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _default_board(conn: sqlite3.Connection, user_id: str) -> str:
+        row = conn.execute(
+            "SELECT id FROM boards WHERE user_id = ? ORDER BY seq LIMIT 1", (user_id,)
+        ).fetchone()
+        if row:
+            return row["id"]
+        board_id = str(uuid.uuid4())
+        conn.execute(
+            "INSERT INTO boards (id, user_id, name) VALUES (?, ?, ?)",
+            (board_id, user_id, DEFAULT_BOARD_NAME),
+        )
+        return board_id
+
+    async def default_board(self, user_id: str) -> str:
+        def op(conn):
+            row = conn.execute(
+                "SELECT id FROM boards WHERE user_id = ? ORDER BY seq LIMIT 1", (user_id,)
+            ).fetchone()
+            if row:
+                return row["id"]
+            # Re-check under the write lock so two workers can't both create a default board.
+            return self._write(conn, lambda c: self._default_board(c, user_id))
+        return await self._run(op)
+
+    @staticmethod
+    def _insert_item(conn: sqlite3.Connection, user_id: str, item: dict) -> None:
+        conn.execute(
+            "INSERT INTO items (id, user_id, board_id, type, title, description, metadata_json, source_url, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                item["id"], user_id, item["board_id"], item["type"], item["title"],
+                item.get("description", ""), json.dumps(item.get("metadata") or {}), item.get("source_url", ""),
+                item.get("created_at") or time.time(),
+            ),
+        )
+
+    async def add_item(self, user_id: str, item: dict) -> None:
+        await self._run(lambda conn: self._insert_item(conn, user_id, item))
+
+    async def add_item_once(
+        self, user_id: str, item: dict, key: str, request_fingerprint: str, ttl: float
+    ) -> tuple[dict, bool]:
+        def op(conn):
+            # under the write lock: a duplicate on any worker waits here, then sees the key
+            now = time.time()
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+            row = conn.execute(
+                "SELECT fingerprint, item_id, board_id FROM idempotency_keys WHERE user_id = ? AND key = ?",
+                (user_id, key),
+            ).fetchone()
+            if row is not None:
+                if row["fingerprint"] != request_fingerprint:
+                    raise IdempotencyConflict(key)
+                return {"id": row["item_id"], "board_id": row["board_id"]}, True
+            self._insert_item(conn, user_id, item)
+            conn.execute(
+                "INSERT INTO idempotency_keys (user_id, key, fingerprint, item_id, board_id, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, key, request_fingerprint, item["id"], item["board_id"], now + ttl),
+            )
+            return {"id": item["id"], "board_id": item["board_id"]}, False
+        return await self._run(lambda conn: self._write(conn, op))
+
+    async def list_items(
+        self,
+        user_id: str,
+        board_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[set[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        after = decode_cursor(cursor) or 0
+        sql = f"SELECT seq, {_select_columns(fields)} FROM items WHERE user_id = ? AND seq > ?"
+        params: list = [user_id, after]
+        if board_id:
+            sql += " AND board_id = ?"
+            params.append(board_id)
+        sql += " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        def op(conn):
+            rows = conn.execute(sql, params).fetchall()
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1]["seq"])
+            return [_row_to_item(r) for r in rows], next_cursor
+        return await self._run(op)
+
+    async def delete_item(self, user_id: str, item_id: str) -> bool:
+        return await self._run(lambda conn: conn.execute(
+            "DELETE FROM items WHERE id = ? AND user_id = ?", (item_id, user_id)
+        ).rowcount > 0)
+
+    async def move_item(self, user_id: str, item_id: str, board_id: str) -> bool:
+        return await self._run(lambda conn: conn.execute(
+            "UPDATE items SET board_id = ? WHERE id = ? AND user_id = ?", (board_id, item_id, user_id)
+        ).rowcount > 0)
+
+    async def list_boards(self, user_id: str, summary: bool = False) -> list[dict]:
+        if not summary:
+            return await self._run(lambda conn: [dict(r) for r in conn.execute(
+                "SELECT id, name FROM boards WHERE user_id = ? ORDER BY seq", (user_id,)
+            ).fetchall()])
+
+        def op(conn):
+            rows = conn.execute(
+                "SELECT b.id, b.name, b.item_count, i.id AS item_id, i.metadata_json, i.created_at "
+                "FROM boards b LEFT JOIN items i ON i.seq = b.latest_seq "
+                "WHERE b.user_id = ? ORDER BY b.seq",
+                (user_id,),
+            ).fetchall()
+            out = []
+            for r in rows:
+                latest = None
+                if r["item_id"] is not None:
+                    latest = _row_to_item({"id": r["item_id"], "metadata_json": r["metadata_json"], "created_at": r["created_at"]})
+                out.append(board_summary({"id": r["id"], "name": r["name"]}, r["item_count"], latest))
+            return out
+        return await self._run(op)
+
+    async def add_board(self, user_id: str, board: dict) -> None:
+        await self._run(lambda conn: conn.execute(
+            "INSERT INTO boards (id, user_id, name) VALUES (?, ?, ?)", (board["id"], user_id, board["name"])
+        ))
+
+    async def delete_board(self, user_id: str, board_id: str, reassign_to: str) -> None:
+        def op(conn):
+            conn.execute("DELETE FROM boards WHERE id = ? AND user_id = ?", (board_id, user_id))
+            conn.execute(
+                "UPDATE items SET board_id = ? WHERE user_id = ? AND board_id = ?",
+                (reassign_to, user_id, board_id),
+            )
+        await self._run(lambda conn: self._write(conn, op))
+
+    async def put_blobs(self, user_id: str, item_id: str, blobs: dict[str, tuple[bytes, str]]) -> bool:
+        def op(conn):
+            # the existence check and inserts share the write lock, so a concurrent delete
+            # either removes these blobs (trigger) or makes this a no-op
+            if conn.execute("SELECT 1 FROM items WHERE id = ? AND user_id = ?", (item_id, user_id)).fetchone() is None:
+                return False
+            conn.executemany(
+                "INSERT OR REPLACE INTO item_blobs (item_id, name, mime, data) VALUES (?, ?, ?, ?)",
+                [(item_id, name, mime, data) for name, (data, mime) in blobs.items()],
+            )
+            return True
+        return await self._run(lambda conn: self._write(conn, op))
+
+    async def get_blob(self, user_id: str, item_id: str, name: str) -> Optional[tuple[bytes, str]]:
+        def op(conn):
+            row = conn.execute(
+                "SELECT b.data, b.mime FROM item_blobs b JOIN items i ON i.id = b.item_id "
+                "WHERE b.item_id = ? AND b.name = ? AND i.user_id = ?",
+                (item_id, name, user_id),
+            ).fetchone()
+            return (row["data"], row["mime"]) if row else None
+        return await self._run(op)
+
+    async def bulk(self, user_id: str, ops: list[tuple]) -> list[dict]:
+        def op(conn):
+            results = []
+            for o in ops:
+                kind = o[0]
+                if kind == "add":
+                    self._insert_item(conn, user_id, o[1])
+                    results.append({"ok": True})
+                elif kind == "move":
+                    cur = conn.execute(
+                        "UPDATE items SET board_id = ? WHERE id = ? AND user_id = ?", (o[2], o[1], user_id)
+                    )
+                    results.append({"ok": cur.rowcount > 0})
+                elif kind == "delete":
+                    cur = conn.execute("DELETE FROM items WHERE id = ? AND user_id = ?", (o[1], user_id))
+                    results.append({"ok": cur.rowcount > 0})
+                elif kind == "move_all":
+                    moved = 0
+                    if o[1] != o[2]:
+                        moved = conn.execute(
+                            "UPDATE items SET board_id = ? WHERE user_id = ? AND board_id = ?", (o[2], user_id, o[1])
+                        ).rowcount
+                    results.append({"ok": True, "moved": moved})
+                else:
+                    raise ValueError(f"Unknown bulk op: {kind}")
+            return results
+        return await self._run(lambda conn: self._write(conn, op))
+
+    shared_changes = True
+
+    async def append_change(self, user_id: str, event: str, data: str) -> int:
+        return await self._run(lambda conn: conn.execute(
+            "INSERT INTO changes (user_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, event, data, time.time()),
+        ).lastrowid)
+
+    async def changes_after(self, seq: int, limit: int) -> list[tuple[int, str, str, str]]:
+        return await self._run(lambda conn: [tuple(r) for r in conn.execute(
+            "SELECT seq, user_id, event, data FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        ).fetchall()])
+
+    async def last_change(self) -> int:
+        return await self._run(lambda conn: conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0])
+
+    async def prune_changes(self, before: float) -> None:
+        await self._run(lambda conn: conn.execute("DELETE FROM changes WHERE created_at < ?", (before,)))
+
+    async def prewarm(self) -> None:
+        """Open a connection on every pool thread and touch both tables' pages."""
+        barrier = threading.Barrier(self._threads)
+
+        def op():
+            conn = self._conn()
+            conn.execute("SELECT 1 FROM items LIMIT 1").fetchall()
+            conn.execute("SELECT 1 FROM boards LIMIT 1").fetchall()
+            try:
+                barrier.wait(timeout=5)  # hold this thread so each task lands on a different one
+            except threading.BrokenBarrierError:
+                pass
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, op) for _ in range(self._threads)))
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
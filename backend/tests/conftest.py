@@ -0,0 +1,50 @@
+import os
+import sys
+from pathlib import Path
+
+# The app uses flat imports (`from config import ...`) and reads config at import time.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("REQUIRE_AUTH", "0")
+os.environ.setdefault("DEDALUS_API_KEY", "test-key")
+os.environ.setdefault("ANALYZE_RATE", "0")
+os.environ.setdefault("ANALYZE_DAILY_QUOTA", "0")
+os.environ.setdefault("GUARD_MAX_RETRIES", "0")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One app lifespan for the session: shutdown stops the module-level worker pools for good."""
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def upstream_handler(client, monkeypatch):
+    """Install a MockTransport on the shared upstream client; set `.handler` to answer requests."""
+    import upstream
+    from guard import UpstreamGuard
+    from label_cache import LabelCache
+    from phash_cache import PerceptualCache
+    from routes import analyze
+
+    class Upstream:
+        handler = None
+        calls = 0
+
+    state = Upstream()
+
+    def dispatch(request: httpx.Request) -> httpx.Response:
+        state.calls += 1
+        return state.handler(request)
+
+    monkeypatch.setattr(upstream, "_client", httpx.AsyncClient(transport=httpx.MockTransport(dispatch)))
+    monkeypatch.setattr(analyze, "result_cache", PerceptualCache())
+    monkeypatch.setattr(analyze, "product_cache", LabelCache())
+    monkeypatch.setattr(analyze, "guard", UpstreamGuard())
+    yield state
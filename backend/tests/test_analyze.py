@@ -0,0 +1,54 @@
+import base64
+import io
+import json
+
+import httpx
+from PIL import Image
+
+
+def chat(content: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+def png(color) -> str:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(out, "PNG")
+    return base64.b64encode(out.getvalue()).decode()
+
+
+def test_refused_connection_is_bad_gateway(client, upstream_handler):
+    def refuse(request):
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    upstream_handler.handler = refuse
+    r = client.post("/analyze", json={"image": png("red"), "mimeType": "image/png"})
+    assert r.status_code == 502
+    assert "Connection refused" in r.json()["detail"]
+
+
+def test_products_failure_degrades_to_description(client, upstream_handler):
+    def vision_then_refuse(request):
+        if upstream_handler.calls == 1:
+            return chat("red mug")
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    upstream_handler.handler = vision_then_refuse
+    r = client.post("/analyze", json={"image": png("red"), "mimeType": "image/png"})
+    assert r.status_code == 200
+    assert r.json()["description"] == "red mug"
+    assert r.json()["similarProducts"] == []
+
+
+def test_flat_crops_of_different_colours_do_not_share_a_cache_entry(client, upstream_handler):
+    def describe(request):
+        content = json.loads(request.content)["messages"][0]["content"]
+        if isinstance(content, str):  # products step
+            return chat('[{"name": "Mug", "search_query": "mug"}]')
+        return chat(f"description {upstream_handler.calls}")
+
+    upstream_handler.handler = describe
+    red = client.post("/analyze", json={"image": png("red"), "mimeType": "image/png"})
+    green = client.post("/analyze", json={"image": png("green"), "mimeType": "image/png"})
+    assert red.status_code == green.status_code == 200
+    assert red.json()["description"] != green.json()["description"]
+    assert upstream_handler.calls == 4  # vision + products for each crop
@@ -0,0 +1,31 @@
+import asyncio
+
+from changefeed import ChangeFeed
+from storage.sqlite import SQLiteItemStore
+
+
+def test_events_reach_connections_on_another_worker(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "items.db")
+        # two workers: separate stores and feeds over one database file
+        store_a, store_b = SQLiteItemStore(path, threads=1), SQLiteItemStore(path, threads=1)
+        feed_a, feed_b = ChangeFeed(poll_interval=0.01), ChangeFeed(poll_interval=0.01)
+        await feed_a.start(store_a)
+        await feed_b.start(store_b)
+        stream = feed_b.stream("u1")
+        try:
+            assert (await anext(stream)).startswith("event: ready")
+            await feed_a.publish("u2", "item.deleted", id="other-user")
+            await feed_a.publish("u1", "item.deleted", id="i1")
+            frame = await asyncio.wait_for(anext(stream), 2)
+        finally:
+            await stream.aclose()
+            feed_a.close()
+            feed_b.close()
+            await store_a.close()
+            await store_b.close()
+        return frame
+
+    frame = asyncio.run(scenario())
+    assert "event: item.deleted" in frame
+    assert '"id":"i1"' in frame
@@ -0,0 +1,30 @@
+from config import ITEMS_DEFAULT_PAGE
+
+
+def test_list_items_is_paged_by_default(client):
+    board = client.post("/boards", json={"name": "paging"}).json()["id"]
+    total = ITEMS_DEFAULT_PAGE + 5
+    r = client.post(
+        "/items/bulk",
+        json={"ops": [{"op": "save", "item": {"type": "p", "title": f"t{i}", "board_id": board}} for i in range(total)]},
+    )
+    assert r.status_code == 200
+
+    first = client.get("/items", params={"board_id": board}).json()
+    assert len(first["items"]) == ITEMS_DEFAULT_PAGE
+    rest = client.get("/items", params={"board_id": board, "cursor": first["next_cursor"]}).json()
+    assert len(rest["items"]) == 5 and rest["next_cursor"] is None
+
+    everything = client.get("/items", params={"board_id": board, "all": "true"}).json()
+    assert len(everything["items"]) == total and everything["next_cursor"] is None
+
+
+def test_bulk_reports_the_board_each_item_was_saved_to(client):
+    source = client.post("/boards", json={"name": "source"}).json()["id"]
+    target = client.post("/boards", json={"name": "target"}).json()["id"]
+    results = client.post("/items/bulk", json={"ops": [
+        {"op": "save", "item": {"type": "p", "title": "a", "board_id": source}},
+        {"op": "move_all", "from_board_id": source, "to_board_id": target},
+    ]}).json()["results"]
+    assert results[0]["board_id"] == source
+    assert results[1]["moved"] == 1
@@ -0,0 +1,106 @@
+"""
+Thumbnails for images saved inline in item metadata, rendered off the request path.
+
+save_item moves the inline image into an item blob and schedules render() on this module's
+thread pool (separate from imaging's, so saves never queue behind vision preprocessing);
+every THUMBNAIL_SIZES variant is then stored as another blob of the item. Without Pillow
+nothing is rendered and thumbnail requests are answered with the original.
+"""
+import asyncio
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import THUMBNAIL_FORMAT, THUMBNAIL_QUALITY, THUMBNAIL_SIZES, THUMBNAIL_WORKERS
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=max(1, THUMBNAIL_WORKERS), thread_name_prefix="thumbnails")
+
+_stats = {"rendered": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0}
+
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),  # RIFF....WEBP
+)
+
+
+def available() -> bool:
+    return Image is not None and bool(THUMBNAIL_SIZES)
+
+
+def sniff_mime(data: bytes) -> Optional[str]:
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    return None
+
+
+def pick_size(requested: Optional[int]) -> int:
+    """Smallest configured size covering the request (the largest if none does)."""
+    if requested is None:
+        return THUMBNAIL_SIZES[0]
+    return next((s for s in THUMBNAIL_SIZES if s >= requested), THUMBNAIL_SIZES[-1])
+
+
+def _encode(img) -> tuple[bytes, str]:
+    fmt = "WEBP" if THUMBNAIL_FORMAT == "WEBP" else "JPEG"
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        rgba = img.convert("RGBA")
+        bg = Image.new("RGB", rgba.size, (255, 255, 255))
+        bg.paste(rgba, mask=rgba.getchannel("A"))
+        img = bg
+    elif img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        img.save(out, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+    else:
+        img.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue(), f"image/{fmt.lower()}"
+
+
+def render_bytes(raw: bytes) -> dict[int, tuple[bytes, str]]:
+    """Blocking: {size: (bytes, mime)} for every configured size; {} if raw is not a decodable image."""
+    if not available():
+        return {}
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            img.load()
+            img = ImageOps.exif_transpose(img)
+            out = {}
+            for size in sorted(THUMBNAIL_SIZES, reverse=True):
+                # each smaller size is downscaled from the previous one, not from the original
+                img.thumbnail((size, size), Image.LANCZOS)
+                out[size] = _encode(img)
+    except Exception as e:
+        _stats["failed"] += 1
+        logger.info("thumbnail render skipped (%s: %s)", type(e).__name__, e)
+        return {}
+    _stats["rendered"] += 1
+    _stats["bytes_in"] += len(raw)
+    _stats["bytes_out"] += sum(len(data) for data, _ in out.values())
+    return out
+
+
+async def render(raw: bytes) -> dict[int, tuple[bytes, str]]:
+    if not available():
+        return {}
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, render_bytes, raw)
+
+
+def stats() -> dict:
+    return {"enabled": available(), "sizes": list(THUMBNAIL_SIZES), **_stats}
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,111 @@
+"""
+Shared HTTP client for upstream (Dedalus) calls.
+One pooled AsyncClient is opened in the app lifespan and reused by every request,
+so /analyze no longer pays a TLS handshake per upstream call.
+"""
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import (
+    DEDALUS_API_URL,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_HTTP2,
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_KEEPALIVE,
+    UPSTREAM_POOL_TIMEOUT,
+)
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=UPSTREAM_HTTP2 and _HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        # Only connecting and pool waits are bounded here; response time is bounded once, by
+        # deadline.bounded() around each call, so the guard sees a single kind of timeout.
+        timeout=httpx.Timeout(
+            None,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            pool=UPSTREAM_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def start() -> None:
+    """Open the shared client. Called from the FastAPI lifespan."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def prewarm(connections: int) -> None:
+    """
+    Open pooled connections (DNS, TCP, TLS) to the Dedalus host before the first request.
+    Uses HEAD on the origin; any response or error is fine, only the connection matters.
+    """
+    if connections <= 0:
+        return
+    parts = urlsplit(DEDALUS_API_URL)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    client = get_client()
+    results = await asyncio.gather(
+        *(asyncio.wait_for(client.head(origin), UPSTREAM_CONNECT_TIMEOUT * 2) for _ in range(connections)),
+        return_exceptions=True,
+    )
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        logger.warning("Upstream prewarm: %d of %d connections failed (%s)", len(failed), connections, failed[0])
+
+
+async def stop() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if the lifespan did not run (e.g. scripts)."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def pool_stats() -> dict:
+    """Connection pool counters for sizing: open, idle, active connections and queued requests."""
+    if _client is None:
+        return {"started": False}
+    # httpx does not expose pool state publicly; read it from the underlying httpcore pool.
+    pool = getattr(_client._transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for c in connections if c.is_idle())
+    requests = list(getattr(pool, "_requests", []) or [])
+    waiting = sum(1 for r in requests if getattr(r, "connection", None) is None)
+    return {
+        "started": True,
+        "http2": UPSTREAM_HTTP2 and _HTTP2_AVAILABLE,
+        "max_connections": UPSTREAM_MAX_CONNECTIONS,
+        "max_keepalive": UPSTREAM_MAX_KEEPALIVE,
+        "open": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "waiting": waiting,
+    }
@@ -43,6 +43,21 @@ export default function DashboardPage() {
     });
   }
 
+  // GET /items is paged; follow next_cursor to load every item
+  async function fetchAllItems(): Promise<SavedItem[]> {
+    const all: SavedItem[] = [];
+    let cursor: string | null = null;
+    do {
+      const query = cursor ? `?limit=500&cursor=${encodeURIComponent(cursor)}` : "?limit=500";
+      const r = await fetchWithAuth(`${API_URL}/items${query}`);
+      if (!r.ok) break;
+      const page = await r.json();
+      if (Array.isArray(page.items)) all.push(...page.items);
+      cursor = page.next_cursor ?? null;
+    } while (cursor);
+    return all;
+  }
+
   useEffect(() => {
     const token = getToken();
     if (!token) {
@@ -53,9 +68,7 @@ export default function DashboardPage() {
       fetchWithAuth(`${API_URL}/boards`).then((r) =>
         r.ok ? r.json() : { boards: [] }
       ),
-      fetchWithAuth(`${API_URL}/items`).then((r) =>
-        r.ok ? r.json() : { items: [] }
-      ),
+      fetchAllItems().then((items) => ({ items })),
     ])
       .then(([boardsData, itemsData]) => {
         const boardList = Array.isArray(boardsData.boards) ? boardsData.boards : [];
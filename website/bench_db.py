@@ -0,0 +1,89 @@
+"""
+Microbenchmark: db.py operations with long-lived per-thread connections against the old
+connect-per-call behavior (LENS_DB_PERSISTENT=0), on a scratch database.
+
+    python bench_db.py --seconds 2 --threads 1 4 --bookmarks 500
+
+Each operation is called in a loop for --seconds by every thread; ops/sec is the total.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+_tmp = tempfile.mkdtemp(prefix="lens-bench-")
+os.environ["LENS_DB_PATH"] = str(Path(_tmp) / "bench.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import db  # noqa: E402
+
+
+def seed(bookmarks: int, image_kb: int) -> tuple[str, list[str]]:
+    db.init_db()
+    uid = db.create_user("bench", "x" * 60)
+    ids = [
+        db.create_bookmark(uid, os.urandom(image_kb * 1024), f"Bookmark {i}", [{"title": "Lamp", "price": "$40"}], f"https://example.com/{i}")
+        for i in range(bookmarks)
+    ]
+    return uid, ids
+
+
+def run(fn, threads: int, seconds: float) -> float:
+    """Total calls/second across `threads` threads each calling fn for `seconds`."""
+    counts = [0] * threads
+    start = threading.Barrier(threads + 1)
+
+    def worker(slot: int) -> None:
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        n = 0
+        while time.perf_counter() < deadline:
+            fn(n)
+            n += 1
+        counts[slot] = n
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    start.wait()
+    for t in pool:
+        t.join()
+    db.close_connections()
+    return sum(counts) / seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--bookmarks", type=int, default=500)
+    parser.add_argument("--image-kb", type=int, default=24)
+    args = parser.parse_args()
+
+    uid, ids = seed(args.bookmarks, args.image_kb)
+    image = os.urandom(args.image_kb * 1024)
+    light = {"id", "description", "source_url", "created_at"}
+    ops = {
+        "get_user_by_username": lambda n: db.get_user_by_username("bench"),
+        "get_bookmark": lambda n: db.get_bookmark(ids[n % len(ids)], uid),
+        "get_bookmarks_page(20)": lambda n: db.get_bookmarks_page(uid, limit=20, fields=light),
+        "create_bookmark": lambda n: db.create_bookmark(uid, image, "bench", [], None),
+    }
+
+    print(f"{'operation':<24} {'threads':>7} {'per-call ops/s':>15} {'persistent ops/s':>17} {'speedup':>8}")
+    for name, fn in ops.items():
+        for threads in args.threads:
+            db.DB_PERSISTENT = False
+            per_call = run(fn, threads, args.seconds)
+            db.DB_PERSISTENT = True
+            persistent = run(fn, threads, args.seconds)
+            print(f"{name:<24} {threads:>7} {per_call:>15.0f} {persistent:>17.0f} {persistent / per_call:>7.1f}x")
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
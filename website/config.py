@@ -19,6 +19,10 @@ def _env(key: str, default: Optional[str] = None) -> Optional[str]:
     return os.environ.get(key, default)
 
 
+# Server bind address (python serve.py)
+HOST = _env("HOST", "0.0.0.0")
+PORT = int(_env("PORT", "8000"))
+
 # API (leave empty to skip API key check)
 API_KEY = _env("LENS_API_KEY", "")
 SECRET_KEY = _env("LENS_SECRET_KEY", "change-me-in-production")
@@ -29,6 +33,26 @@ SECRET_KEY = _env("LENS_SECRET_KEY", "change-me-in-production")
 ADMIN_USER = _env("LENS_ADMIN_USER", "admin")
 ADMIN_PASSWORD = _env("LENS_ADMIN_PASSWORD", "admin")  # In production use hashed
 
+# Binary bookmark uploads (POST /api/bookmarks/upload)
+MAX_UPLOAD_BYTES = int(_env("LENS_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# SQLite (db.py): one long-lived connection per thread; LENS_DB_PERSISTENT=0 restores connect-per-call
+DB_PERSISTENT = (_env("LENS_DB_PERSISTENT", "1") or "").strip().lower() in ("1", "true", "yes")
+DB_BUSY_TIMEOUT_MS = int(_env("LENS_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_KB = int(_env("LENS_DB_CACHE_KB", "8192"))  # page cache per connection
+DB_MMAP_BYTES = int(_env("LENS_DB_MMAP_BYTES", str(64 * 1024 * 1024)))
+
+# Bookmark thumbnails: longest-side sizes in px, rendered after each save by a background pool
+THUMBNAIL_SIZES = sorted({int(s) for s in (_env("LENS_THUMBNAIL_SIZES", "160,480") or "").split(",") if s.strip()})
+THUMBNAIL_FORMAT = (_env("LENS_THUMBNAIL_FORMAT", "WEBP") or "WEBP").strip().upper()  # WEBP | JPEG
+THUMBNAIL_QUALITY = int(_env("LENS_THUMBNAIL_QUALITY", "75"))
+THUMBNAIL_WORKERS = int(_env("LENS_THUMBNAIL_WORKERS", "2"))
+
+# Idempotency-Key replay window (seconds), and opt-in content dedupe: a save identical to an
+# existing bookmark (image, description, results and source URL) returns the existing id
+IDEMPOTENCY_TTL = int(_env("LENS_IDEMPOTENCY_TTL", "86400"))
+DEDUPE_BOOKMARKS = (_env("LENS_DEDUPE_BOOKMARKS", "0") or "").strip().lower() in ("1", "true", "yes")
+
 # Snowflake
 SNOWFLAKE_ACCOUNT = _env("SNOWFLAKE_ACCOUNT")
 SNOWFLAKE_USER = _env("SNOWFLAKE_USER")
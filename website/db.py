@@ -1,12 +1,24 @@
 """
 SQLite-based storage for users and bookmarks.
 """
+import base64
+import binascii
+import hashlib
 import json
+import logging
 import os
 import sqlite3
+import threading
+import time
 import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import DB_BUSY_TIMEOUT_MS, DB_CACHE_KB, DB_MMAP_BYTES, DB_PERSISTENT
+from timing import timed
+
+logger = logging.getLogger(__name__)
 
 # Use /tmp on Netlify (ephemeral); project dir for local/dev
 _proj_dir = Path(__file__).resolve().parent
@@ -18,14 +30,203 @@ else:
     DB_PATH = _proj_dir / "lens.db"
 
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+# per-connection cache of compiled statements; every query here is a fixed string (or one of a
+# few get_bookmarks_page variants), so with long-lived connections each is prepared once
+STATEMENT_CACHE = 256
+
+_local = threading.local()
+_conns_lock = threading.Lock()
+_conns: List[sqlite3.Connection] = []
+_generation = 0
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE,
+        check_same_thread=False,  # owned by one thread; close_connections() may close it from another
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
 
+def get_conn() -> sqlite3.Connection:
+    """
+    This thread's long-lived connection, opened on first use. Reopened after close_connections()
+    and in a forked child (a SQLite connection must not cross a fork).
+    """
+    cached = getattr(_local, "conn", None)
+    if cached is not None and cached[0] == _generation and cached[1] == os.getpid():
+        return cached[2]
+    conn = _connect()
+    with _conns_lock:
+        _conns.append(conn)
+    _local.conn = (_generation, os.getpid(), conn)
+    return conn
+
+
+def close_connections() -> None:
+    """Close every connection opened by get_conn(); threads open a fresh one on next use."""
+    global _generation
+    with _conns_lock:
+        _generation += 1
+        conns = _conns[:]
+        _conns.clear()
+    for conn in conns:
+        conn.close()
+
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """The thread's connection, or with LENS_DB_PERSISTENT=0 a plain one closed afterwards."""
+    if DB_PERSISTENT:
+        yield get_conn()
+        return
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """connection() that commits on success and rolls back on error, so a failed write never
+    leaves a long-lived connection inside an open transaction."""
+    with connection() as conn:
+        with conn:
+            yield conn
+
+
+# images.refcount = number of bookmarks pointing at the image; the last one out deletes it
+IMAGE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS bookmarks_image_ref AFTER INSERT ON bookmarks
+       WHEN NEW.image_sha256 IS NOT NULL BEGIN
+           UPDATE images SET refcount = refcount + 1 WHERE sha256 = NEW.image_sha256;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS bookmarks_image_unref AFTER DELETE ON bookmarks
+       WHEN OLD.image_sha256 IS NOT NULL BEGIN
+           UPDATE images SET refcount = refcount - 1 WHERE sha256 = OLD.image_sha256;
+           DELETE FROM images WHERE sha256 = OLD.image_sha256 AND refcount <= 0;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS bookmarks_image_reref AFTER UPDATE OF image_sha256 ON bookmarks
+       WHEN OLD.image_sha256 IS NOT NEW.image_sha256 BEGIN
+           UPDATE images SET refcount = refcount + 1 WHERE sha256 = NEW.image_sha256;
+           UPDATE images SET refcount = refcount - 1 WHERE sha256 = OLD.image_sha256;
+           DELETE FROM images WHERE sha256 = OLD.image_sha256 AND refcount <= 0;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS images_thumbnails_delete AFTER DELETE ON images BEGIN
+           DELETE FROM thumbnails WHERE sha256 = OLD.sha256;
+       END""",
+)
+
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),  # RIFF....WEBP
+)
+
+
+def sniff_mime(data: bytes) -> Optional[str]:
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    return None
+
+
+def decode_image(image_base64: str) -> bytes:
+    """Raw bytes of a base64 image, accepting a data: URL prefix. Raises ValueError."""
+    if image_base64.startswith("data:") and "," in image_base64:
+        image_base64 = image_base64.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image: {e}")
+
+
+def _store_image(conn: sqlite3.Connection, data: bytes, mime: Optional[str]) -> str:
+    """Insert the image unless its content is already stored; returns its SHA-256."""
+    sha = hashlib.sha256(data).hexdigest()
+    conn.execute(
+        "INSERT OR IGNORE INTO images (sha256, data, mime, size) VALUES (?, ?, ?, ?)",
+        (sha, data, mime or sniff_mime(data), len(data)),
+    )
+    return sha
+
+
+def migrate_inline_images(conn: sqlite3.Connection, batch_size: int = 500, progress=None) -> Dict[str, int]:
+    """
+    Move legacy bookmarks.image_base64 text into the images table: decode each row once, store
+    the bytes under their SHA-256, point the row at it, then recount references and drop the
+    column (SQLite >= 3.35; older versions keep it, emptied). Commits after every batch when the
+    connection is not already inside a transaction, so an interrupted run resumes where it stopped.
+    Rows whose text is not valid base64 are logged and left unmigrated; the column is kept while
+    any remain.
+    """
+    stats = {"rows": 0, "skipped": 0, "text_bytes": 0, "image_bytes": 0}
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(bookmarks)")}
+    if "image_base64" not in cols:
+        return stats
+    own_commits = not conn.in_transaction
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, image_base64 FROM bookmarks WHERE image_base64 IS NOT NULL AND rowid > ? "
+            "ORDER BY rowid LIMIT ?",
+            (last_rowid, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+        for rowid, text in rows:
+            last_rowid = rowid
+            try:
+                data = decode_image(text)
+            except ValueError as e:
+                logger.warning("bookmark rowid %d left unmigrated: %s", rowid, e)
+                stats["skipped"] += 1
+                continue
+            sha = _store_image(conn, data, None)
+            conn.execute("UPDATE bookmarks SET image_sha256 = ?, image_base64 = NULL WHERE rowid = ?", (sha, rowid))
+            stats["rows"] += 1
+            stats["text_bytes"] += len(text)
+        if own_commits:
+            conn.commit()
+        if progress:
+            progress(stats)
+    # rows whose hash was already set by the dedupe column never fired the update trigger
+    counts = conn.execute(
+        "SELECT image_sha256, COUNT(*) FROM bookmarks WHERE image_sha256 IS NOT NULL GROUP BY image_sha256"
+    ).fetchall()
+    conn.execute("UPDATE images SET refcount = 0")
+    conn.executemany("UPDATE images SET refcount = ? WHERE sha256 = ?", [(n, sha) for sha, n in counts])
+    conn.execute("DELETE FROM images WHERE refcount <= 0")
+    if stats["skipped"]:
+        logger.warning("kept bookmarks.image_base64: %d rows could not be decoded", stats["skipped"])
+    elif sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute("ALTER TABLE bookmarks DROP COLUMN image_base64")
+    if own_commits:
+        conn.commit()
+    stats["image_bytes"] = conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+    return stats
+
+
 def init_db():
-    conn = get_conn()
+    with transaction() as conn:
+        legacy = create_schema(conn)
+        if legacy:
+            migrate_inline_images(conn)
+
+
+def create_schema(conn: sqlite3.Connection) -> bool:
+    """Create or upgrade tables, indexes and triggers. True if bookmarks still has image_base64."""
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
@@ -36,93 +237,279 @@ def init_db():
         CREATE TABLE IF NOT EXISTS bookmarks (
             id TEXT PRIMARY KEY,
             user_id TEXT NOT NULL,
-            image_base64 TEXT,
+            image_sha256 TEXT,
             description TEXT,
             results_json TEXT,
             source_url TEXT,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
+        CREATE TABLE IF NOT EXISTS images (
+            sha256 TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            mime TEXT,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            mime TEXT NOT NULL,
+            PRIMARY KEY (sha256, size)
+        );
         CREATE INDEX IF NOT EXISTS idx_bookmarks_user ON bookmarks(user_id);
+        CREATE INDEX IF NOT EXISTS idx_bookmarks_user_created ON bookmarks(user_id, created_at);
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            response_json TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at);
     """)
-    conn.commit()
-    conn.close()
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(bookmarks)")}
+    if "image_sha256" not in cols:
+        conn.execute("ALTER TABLE bookmarks ADD COLUMN image_sha256 TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bookmarks_user_image ON bookmarks(user_id, image_sha256, source_url)"
+    )
+    for stmt in IMAGE_TRIGGERS:
+        conn.execute(stmt)
+    return "image_base64" in cols
 
 
+@timed("db.create_user")
 def create_user(username: str, password_hash: str) -> str:
-    conn = get_conn()
     uid = str(uuid.uuid4())
-    conn.execute(
-        "INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
-        (uid, username.lower(), password_hash),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+            (uid, username.lower(), password_hash),
+        )
     return uid
 
 
+@timed("db.get_user_by_username")
 def get_user_by_username(username: str) -> Optional[Dict]:
-    conn = get_conn()
-    row = conn.execute(
-        "SELECT id, username, password_hash FROM users WHERE username = ?",
-        (username.lower(),),
-    ).fetchone()
-    conn.close()
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT id, username, password_hash FROM users WHERE username = ?",
+            (username.lower(),),
+        ).fetchone()
     return dict(row) if row else None
 
 
-def create_bookmark(user_id: str, image_base64: str, description: str, results: List[Dict], source_url: Optional[str] = None) -> str:
-    conn = get_conn()
+@timed("db.create_bookmark")
+def create_bookmark(
+    user_id: str,
+    image: bytes,
+    description: str,
+    results: List[Dict],
+    source_url: Optional[str] = None,
+    image_mime: Optional[str] = None,
+) -> str:
+    """Store the image bytes once per distinct content and the bookmark row pointing at them."""
     bid = str(uuid.uuid4())
-    conn.execute(
-        "INSERT INTO bookmarks (id, user_id, image_base64, description, results_json, source_url) VALUES (?, ?, ?, ?, ?, ?)",
-        (bid, user_id, image_base64, description, json.dumps(results), source_url or ""),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        sha = _store_image(conn, image, image_mime)
+        conn.execute(
+            "INSERT INTO bookmarks (id, user_id, image_sha256, description, results_json, source_url) VALUES (?, ?, ?, ?, ?, ?)",
+            (bid, user_id, sha, description, json.dumps(results), source_url or ""),
+        )
     return bid
 
 
+@timed("db.find_bookmark_by_content")
+def find_bookmark_by_content(
+    user_id: str, image_sha256: str, description: str, results: List[Dict], source_url: Optional[str]
+) -> Optional[str]:
+    """Id of an existing bookmark identical in image, description, results and source URL, if any."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT id FROM bookmarks WHERE user_id = ? AND image_sha256 = ? AND description = ? "
+            "AND results_json = ? AND source_url = ? LIMIT 1",
+            (user_id, image_sha256, description, json.dumps(results), source_url or ""),
+        ).fetchone()
+    return row["id"] if row else None
+
+
+@timed("db.get_idempotent_response")
+def get_idempotent_response(user_id: str, key: str, max_age: float) -> Optional[Dict]:
+    """Stored {fingerprint, response} for an Idempotency-Key still inside the window."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT fingerprint, response_json FROM idempotency_keys WHERE user_id = ? AND key = ? AND created_at >= ?",
+            (user_id, key, time.time() - max_age),
+        ).fetchone()
+    if not row:
+        return None
+    return {"fingerprint": row["fingerprint"], "response": json.loads(row["response_json"])}
+
+
+@timed("db.save_idempotent_response")
+def save_idempotent_response(user_id: str, key: str, fingerprint: str, response: Dict, max_age: float) -> None:
+    """Record a response for replay and drop expired keys (a range delete on the created_at index)."""
+    now = time.time()
+    with transaction() as conn:
+        conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - max_age,))
+        conn.execute(
+            "INSERT OR REPLACE INTO idempotency_keys (user_id, key, fingerprint, response_json, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, key, fingerprint, json.dumps(response), now),
+        )
+
+
+BOOKMARK_FIELDS = ("id", "image_base64", "image_sha256", "description", "results", "source_url", "created_at")
+
+# image_base64 is no longer a column: it is encoded on read from the images table
+_FIELD_SQL = {"results": "b.results_json", "image_base64": "i.data AS image_data"}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_cursor(created_at: str, rowid: int) -> str:
+    raw = json.dumps([created_at, rowid]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, rowid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), int(rowid)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
 def get_bookmarks(user_id: str) -> List[Dict]:
-    conn = get_conn()
-    rows = conn.execute(
-        "SELECT id, image_base64, description, results_json, source_url, created_at FROM bookmarks WHERE user_id = ? ORDER BY created_at DESC",
-        (user_id,),
-    ).fetchall()
-    conn.close()
+    return get_bookmarks_page(user_id)[0]
+
+
+@timed("db.get_bookmarks_page")
+def get_bookmarks_page(
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[Set[str]] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Newest-first keyset page over (created_at, rowid). Returns (bookmarks, next_cursor);
+    next_cursor is None on the last page. fields limits the columns read (e.g. skip image_base64).
+    """
+    cols = [f for f in BOOKMARK_FIELDS if fields is None or f in fields]
+    select = ", ".join(_FIELD_SQL.get(c, f"b.{c}") for c in cols)
+    sql = f"SELECT b.rowid AS _rowid, b.created_at AS _created_at, {select} FROM bookmarks b"
+    if "image_base64" in cols:
+        sql += " LEFT JOIN images i ON i.sha256 = b.image_sha256"
+    sql += " WHERE b.user_id = ?"
+    params: List[Any] = [user_id]
+    if cursor:
+        created_at, rowid = _decode_cursor(cursor)
+        sql += " AND (b.created_at, b.rowid) < (?, ?)"
+        params += [created_at, rowid]
+    sql += " ORDER BY b.created_at DESC, b.rowid DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["_created_at"], rows[-1]["_rowid"])
     out = []
     for r in rows:
         d = dict(r)
+        del d["_rowid"], d["_created_at"]
+        out.append(_bookmark_dict(d))
+    return out, next_cursor
+
+
+def _bookmark_dict(d: Dict) -> Dict:
+    if "results_json" in d:
         try:
             d["results"] = json.loads(d["results_json"]) if d["results_json"] else []
         except (json.JSONDecodeError, TypeError):
             d["results"] = []
         del d["results_json"]
-        out.append(d)
-    return out
+    if "image_data" in d:
+        data = d.pop("image_data")
+        d["image_base64"] = base64.b64encode(data).decode() if data is not None else None
+    return d
 
 
+@timed("db.get_bookmark")
 def get_bookmark(bookmark_id: str, user_id: str) -> Optional[Dict]:
-    conn = get_conn()
-    row = conn.execute(
-        "SELECT id, image_base64, description, results_json, source_url, created_at FROM bookmarks WHERE id = ? AND user_id = ?",
-        (bookmark_id, user_id),
-    ).fetchone()
-    conn.close()
-    if not row:
-        return None
-    d = dict(row)
-    try:
-        d["results"] = json.loads(d["results_json"]) if d["results_json"] else []
-    except (json.JSONDecodeError, TypeError):
-        d["results"] = []
-    del d["results_json"]
-    return d
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT b.id, i.data AS image_data, b.image_sha256, b.description, b.results_json, b.source_url, b.created_at"
+            " FROM bookmarks b LEFT JOIN images i ON i.sha256 = b.image_sha256 WHERE b.id = ? AND b.user_id = ?",
+            (bookmark_id, user_id),
+        ).fetchone()
+    return _bookmark_dict(dict(row)) if row else None
+
+
+@timed("db.get_bookmark_image")
+def get_bookmark_image(bookmark_id: str, user_id: str) -> Optional[Dict]:
+    """{sha256, data, mime} of a bookmark's image, or None if the bookmark or image is missing."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT i.sha256, i.data, i.mime FROM bookmarks b JOIN images i ON i.sha256 = b.image_sha256"
+            " WHERE b.id = ? AND b.user_id = ?",
+            (bookmark_id, user_id),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+@timed("db.get_image")
+def get_image(sha256: str) -> Optional[Dict]:
+    """{sha256, data, mime} by content hash."""
+    with connection() as conn:
+        row = conn.execute("SELECT sha256, data, mime FROM images WHERE sha256 = ?", (sha256,)).fetchone()
+    return dict(row) if row else None
+
+
+@timed("db.get_thumbnail")
+def get_thumbnail(sha256: str, size: int) -> Optional[Dict]:
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT data, mime FROM thumbnails WHERE sha256 = ? AND size = ?", (sha256, size)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+@timed("db.has_thumbnails")
+def has_thumbnails(sha256: str) -> bool:
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM thumbnails WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone() is not None
+
+
+@timed("db.save_thumbnails")
+def save_thumbnails(sha256: str, thumbs: Dict[int, Tuple[bytes, str]]) -> None:
+    """Store rendered {size: (bytes, mime)}; skipped if the image was deleted meanwhile."""
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO thumbnails (sha256, size, data, mime)"
+            " SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM images WHERE sha256 = ?)",
+            [(sha256, size, data, mime, sha256) for size, (data, mime) in thumbs.items()],
+        )
+
+
+@timed("db.image_stats")
+def image_stats() -> Dict[str, int]:
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) AS images, COALESCE(SUM(size), 0) AS bytes, COALESCE(SUM(refcount), 0) AS refs,"
+            " (SELECT COUNT(*) FROM thumbnails) AS thumbnails FROM images"
+        ).fetchone()
+    return dict(row)
 
 
+@timed("db.delete_bookmark")
 def delete_bookmark(bookmark_id: str, user_id: str) -> bool:
-    conn = get_conn()
-    cur = conn.execute("DELETE FROM bookmarks WHERE id = ? AND user_id = ?", (bookmark_id, user_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        cur = conn.execute("DELETE FROM bookmarks WHERE id = ? AND user_id = ?", (bookmark_id, user_id))
     return cur.rowcount > 0
@@ -3,37 +3,82 @@ Lens Capture - FastAPI webhook receiver for Chrome Extension.
 Accepts image/description/metadata and saves to Snowflake via SQL API.
 Includes user auth and bookmarks for the web frontend.
 """
+import hashlib
+import hmac
+import json
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, File, Form, Header, HTTPException, Query, Response, UploadFile, status
 from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
 from auth import create_access_token, decode_token, hash_password, verify_password
-from config import API_KEY, SECRET_KEY, ADMIN_USER, ADMIN_PASSWORD, get_snowflake_config
+from config import (
+    API_KEY,
+    SECRET_KEY,
+    ADMIN_USER,
+    ADMIN_PASSWORD,
+    DEDUPE_BOOKMARKS,
+    IDEMPOTENCY_TTL,
+    MAX_UPLOAD_BYTES,
+    get_snowflake_config,
+)
+from fastjson import FastJSONResponse, body_schema, json_body
 from db import (
+    close_connections,
+    connection,
+    BOOKMARK_FIELDS,
+    InvalidCursor,
     create_bookmark as db_create_bookmark,
     create_user as db_create_user,
+    decode_image,
+    find_bookmark_by_content,
+    get_idempotent_response,
+    save_idempotent_response,
     get_bookmark as db_get_bookmark,
-    get_bookmarks as db_get_bookmarks,
+    get_bookmark_image as db_get_bookmark_image,
+    get_image,
+    get_thumbnail,
+    has_thumbnails,
+    save_thumbnails,
+    get_bookmarks_page as db_get_bookmarks_page,
     get_user_by_username,
     init_db,
 )
 from snowflake_client import insert_lens_vault
+import thumbnails
+from timing import TimingMiddleware, render_prometheus
 
 from fastapi import FastAPI
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm-up before this worker accepts traffic: SQLite connection/pages and the bcrypt backend."""
+    with connection() as conn:
+        conn.execute("SELECT 1 FROM users LIMIT 1").fetchall()
+    hash_password("warmup")  # passlib loads and self-tests bcrypt on first use
+    yield
+    thumbnails.shutdown()  # let queued renders finish and store before the connections close
+    close_connections()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Lens Capture Webhook",
     description="Secure webhook receiver for Lens Capture Chrome Extension → Snowflake",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
+app.add_middleware(TimingMiddleware)
+
 # Init SQLite on startup
 init_db()
 
@@ -65,6 +110,13 @@ class BookmarkPayload(BaseModel):
     sourceUrl: Optional[str] = None
 
 
+class BookmarkMetadata(BaseModel):
+    """BookmarkPayload without the image, sent as the `metadata` part of a binary upload."""
+    description: str = Field(..., description="AI description")
+    similarProducts: List[Dict[str, Any]] = Field(default_factory=list)
+    sourceUrl: Optional[str] = None
+
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -141,9 +193,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
 # --- Webhook ---
 
-@app.post("/api/lens")
+@app.post("/api/lens", openapi_extra=body_schema(LensPayload))
 async def lens_webhook(
-    payload: LensPayload,
+    payload: LensPayload = Depends(json_body(LensPayload)),
     _api_key: str = Depends(require_api_key),
 ):
     """Webhook for extension. Saves to Snowflake LENS_VAULT."""
@@ -193,33 +245,161 @@ async def lens_webhook(
 
 # --- Bookmarks ---
 
-@app.post("/api/bookmarks")
+def _render_thumbnails(image_sha256: str, image: bytes) -> None:
+    """Thumbnail pool job: render and store every size once per distinct image."""
+    if has_thumbnails(image_sha256):
+        return
+    rendered = thumbnails.render(image)
+    if rendered:
+        save_thumbnails(image_sha256, rendered)
+
+
+def _thumbnail_sig(image_sha256: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), image_sha256.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _thumbnail_url(image_sha256: str, size: int) -> str:
+    """
+    Signed, user-independent reference: <img> tags cannot send the bearer token, and the
+    URL only ever reaches clients the bookmark list was served to.
+    """
+    return f"/api/thumbnails/{image_sha256}/{size}?sig={_thumbnail_sig(image_sha256)}"
+
+
+def _save_bookmark(
+    user_id: str,
+    image: bytes,
+    image_mime: Optional[str],
+    meta: "BookmarkMetadata",
+    idempotency_key: Optional[str],
+    response: Response,
+) -> dict:
+    """
+    Create a bookmark unless this is a replay: a known Idempotency-Key returns its stored
+    response, and (opt-in DEDUPE_BOOKMARKS) an identical bookmark returns the original id.
+    """
+    image_sha256 = hashlib.sha256(image).hexdigest()
+    fingerprint = hashlib.sha256(
+        json.dumps([image_sha256, meta.description, meta.similarProducts, meta.sourceUrl], sort_keys=True).encode()
+    ).hexdigest()
+    if idempotency_key:
+        prior = get_idempotent_response(user_id, idempotency_key, IDEMPOTENCY_TTL)
+        if prior:
+            if prior["fingerprint"] != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different payload")
+            response.headers["Idempotent-Replayed"] = "true"
+            return prior["response"]
+    existing = None
+    if DEDUPE_BOOKMARKS:
+        existing = find_bookmark_by_content(
+            user_id, image_sha256, meta.description, meta.similarProducts, meta.sourceUrl
+        )
+    if existing:
+        result = {"id": existing, "status": "saved", "duplicate": True}
+    else:
+        bid = db_create_bookmark(
+            user_id=user_id,
+            image=image,
+            description=meta.description,
+            results=meta.similarProducts,
+            source_url=meta.sourceUrl,
+            image_mime=image_mime,
+        )
+        result = {"id": bid, "status": "saved"}
+        thumbnails.submit(_render_thumbnails, image_sha256, image, key=image_sha256)
+    if idempotency_key:
+        save_idempotent_response(user_id, idempotency_key, fingerprint, result, IDEMPOTENCY_TTL)
+    return result
+
+
+@app.post("/api/bookmarks", openapi_extra=body_schema(BookmarkPayload))
 async def create_bookmark_endpoint(
-    payload: BookmarkPayload,
+    response: Response,
+    payload: BookmarkPayload = Depends(json_body(BookmarkPayload)),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     auth: dict = Depends(require_token),
 ):
-    """Save a bookmark (from extension or web)."""
+    """Save a bookmark (from extension or web). Retries with the same Idempotency-Key are replayed."""
     user = get_user_by_username(auth["sub"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    bid = db_create_bookmark(
-        user_id=user["id"],
-        image_base64=payload.image,
+    meta = BookmarkMetadata(
         description=payload.description,
-        results=payload.similarProducts,
-        source_url=payload.sourceUrl,
+        similarProducts=payload.similarProducts,
+        sourceUrl=payload.sourceUrl,
     )
-    return {"id": bid, "status": "saved"}
+    try:
+        image = decode_image(payload.image)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Image must be base64 (optionally a data: URL)")
+    return _save_bookmark(user["id"], image, None, meta, idempotency_key, response)
+
+
+@app.post("/api/bookmarks/upload")
+async def upload_bookmark_endpoint(
+    response: Response,
+    image: UploadFile = File(..., description="Raw image bytes"),
+    metadata: str = Form(..., description="JSON object: description, similarProducts, sourceUrl"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    auth: dict = Depends(require_token),
+):
+    """Save a bookmark from multipart/form-data, skipping base64 and JSON parsing of the image."""
+    try:
+        meta = BookmarkMetadata.model_validate_json(metadata)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    user = get_user_by_username(auth["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    raw = await image.read()
+    if not raw:
+        raise HTTPException(status_code=400, detail="Empty image")
+    if len(raw) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_UPLOAD_BYTES} bytes")
+    mime = image.content_type if image.content_type and image.content_type.startswith("image/") else None
+    return _save_bookmark(user["id"], raw, mime, meta, idempotency_key, response)
+
+
+# list views get thumbnail references; the inline original (image_base64) only when asked for
+LIST_FIELDS = (*BOOKMARK_FIELDS, "thumbnail_url", "image_url")
+DEFAULT_LIST_FIELDS = tuple(f for f in LIST_FIELDS if f != "image_base64")
 
 
 @app.get("/api/bookmarks")
-async def list_bookmarks(auth: dict = Depends(require_token)):
-    """List current user's bookmarks."""
+async def list_bookmarks(
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size; omit for the full list"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated projection, e.g. id,description,created_at"),
+    auth: dict = Depends(require_token),
+):
+    """List current user's bookmarks, newest first, optionally paginated and projected."""
     user = get_user_by_username(auth["sub"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    items = db_get_bookmarks(user["id"])
-    return {"bookmarks": items}
+    if fields:
+        wanted = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = wanted - set(LIST_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        wanted.add("id")
+    else:
+        wanted = set(DEFAULT_LIST_FIELDS)
+    refs = wanted & {"thumbnail_url", "image_url"}
+    columns = (wanted - refs) | ({"image_sha256"} if refs else set())
+    try:
+        items, next_cursor = db_get_bookmarks_page(user["id"], limit, cursor, columns)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if refs:
+        size = thumbnails.pick_size(None) if thumbnails.THUMBNAIL_SIZES else 0
+        for b in items:
+            sha = b["image_sha256"] if "image_sha256" in wanted else b.pop("image_sha256")
+            if "thumbnail_url" in refs:
+                b["thumbnail_url"] = _thumbnail_url(sha, size) if sha and size else None
+            if "image_url" in refs:
+                b["image_url"] = f"/api/bookmarks/{b['id']}/image" if sha else None
+    # plain dicts: render directly, skipping FastAPI's jsonable_encoder pass over every bookmark
+    return FastJSONResponse({"bookmarks": items, "next_cursor": next_cursor})
 
 
 @app.get("/api/bookmarks/{bookmark_id}")
@@ -234,6 +414,49 @@ async def get_bookmark_endpoint(bookmark_id: str, auth: dict = Depends(require_t
     return b
 
 
+@app.get("/api/bookmarks/{bookmark_id}/image")
+async def get_bookmark_image_endpoint(
+    bookmark_id: str,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    auth: dict = Depends(require_token),
+):
+    """Raw image bytes of a bookmark. Images are content-addressed, so the ETag never changes."""
+    user = get_user_by_username(auth["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    img = db_get_bookmark_image(bookmark_id, user["id"])
+    if not img:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = '"' + img["sha256"] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if if_none_match and etag in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(img["data"], media_type=img["mime"] or "application/octet-stream", headers=headers)
+
+
+@app.get("/api/thumbnails/{image_sha256}/{size}")
+async def get_thumbnail_endpoint(image_sha256: str, size: int, sig: str = Query(...)):
+    """
+    Thumbnail by content hash, authorized by the signature in the URL handed out by the list
+    endpoints. Until the background render has stored it, the original is served (briefly cached).
+    """
+    if not hmac.compare_digest(sig, _thumbnail_sig(image_sha256)):
+        raise HTTPException(status_code=403, detail="Invalid signature")
+    thumb = get_thumbnail(image_sha256, thumbnails.pick_size(size)) if thumbnails.available() else None
+    if thumb:
+        return Response(thumb["data"], media_type=thumb["mime"], headers={
+            "ETag": f'"{image_sha256}-{size}"', "Cache-Control": "private, max-age=31536000, immutable",
+        })
+    img = get_image(image_sha256)
+    if not img:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # e.g. images from before thumbnails; one job renders every size, so key it by image alone
+    thumbnails.submit(_render_thumbnails, image_sha256, img["data"], key=image_sha256)
+    return Response(img["data"], media_type=img["mime"] or "application/octet-stream", headers={
+        "Cache-Control": "private, max-age=60",
+    })
+
+
 @app.delete("/api/bookmarks/{bookmark_id}")
 async def delete_bookmark_endpoint(bookmark_id: str, auth: dict = Depends(require_token)):
     """Delete a bookmark."""
@@ -251,6 +474,12 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage (db.*, snowflake.*) and per-route latency histograms for this worker, Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 # --- Frontend ---
 
 STATIC_DIR = Path(__file__).resolve().parent / "static"
@@ -292,5 +521,6 @@ async def dashboard_page():
 
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # development: python main.py --reload; production: python serve.py
+    import serve
+    serve.main()
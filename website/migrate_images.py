@@ -0,0 +1,62 @@
+"""
+Convert a lens.db written before the content-addressed image store: bookmark images move from
+the image_base64 TEXT column into the images table as raw bytes, stored once per SHA-256.
+
+    python migrate_images.py                      # LENS_DB_PATH or ./lens.db
+    python migrate_images.py /path/to/lens.db --backup /path/to/lens.db.bak
+
+init_db() performs the same conversion on startup; run this beforehand on large databases so
+workers do not start (and contend for the write lock) mid-migration. Safe to re-run or resume.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", nargs="?", default=None, help="default: LENS_DB_PATH or lens.db next to this script")
+    parser.add_argument("--backup", default=None, help="copy the database here (online backup) before migrating")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per committed batch")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip VACUUM (the file keeps its size until then)")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["LENS_DB_PATH"] = args.db
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import db
+
+    path = Path(db.DB_PATH)
+    if not path.exists():
+        parser.error(f"{path} does not exist")
+    size_before = path.stat().st_size
+    conn = db.get_conn()
+    if args.backup:
+        with sqlite3.connect(args.backup) as dest:
+            conn.backup(dest)
+        print(f"backup written to {args.backup}")
+
+    with conn:
+        legacy = db.create_schema(conn)
+    if not legacy:
+        print(f"{path}: already migrated")
+    else:
+        stats = db.migrate_inline_images(
+            conn,
+            batch_size=args.batch_size,
+            progress=lambda s: print(f"  {s['rows']} rows", end="\r", flush=True),
+        )
+        print(f"{path}: moved {stats['rows']} images ({stats['text_bytes']:,} bytes of base64) "
+              f"into {stats['image_bytes']:,} bytes of distinct image data")
+        if stats["skipped"]:
+            print(f"{stats['skipped']} rows are not valid base64 and were left in image_base64")
+    if not args.no_vacuum:
+        conn.execute("VACUUM")
+    db.close_connections()
+    print(f"file size {size_before:,} -> {path.stat().st_size:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Production launcher for the Lens Capture website API:
+
+    python serve.py                       # one worker per available CPU (see --workers)
+    python serve.py --workers 4 --max-requests 5000
+    python serve.py --reload              # development
+
+- pre-forked uvicorn workers sharing one listening socket; they share lens.db (SQLite)
+- uvloop event loop and httptools parser when installed (uvicorn[standard])
+- each worker runs the app lifespan warm-up (SQLite, bcrypt) before it accepts a connection
+- SIGTERM: workers stop accepting and let in-flight requests finish within --graceful-timeout
+- with more than one worker, each exits after --max-requests (plus random jitter) and the
+  supervisor starts a fresh one; a single worker has no supervisor, so it is never recycled
+"""
+import argparse
+import importlib.util
+import inspect
+import os
+from typing import List, Optional
+
+import uvicorn
+
+from config import HOST, PORT
+from db import close_connections, init_db
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Lens Capture website API with production settings.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="default: WEB_CONCURRENCY or available CPUs")
+    parser.add_argument("--max-requests", type=int, default=10000, help="recycle a worker after this many requests (0: never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=None, help="default: 10%% of --max-requests")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0, help="seconds to drain on SIGTERM")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--reload", action="store_true", help="development: single process, restart on code changes")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+    if args.reload:
+        workers = 1
+    workers = max(1, workers)
+    # a lone worker runs without a supervisor: hitting the limit would stop the server for good
+    max_requests = (args.max_requests or None) if workers > 1 else None
+    jitter = args.max_requests_jitter if args.max_requests_jitter is not None else (args.max_requests or 0) // 10
+    options = {}
+    if max_requests and jitter and "limit_max_requests_jitter" in inspect.signature(uvicorn.Config).parameters:
+        options["limit_max_requests_jitter"] = jitter  # not available in older uvicorn releases
+
+    # create or migrate the schema once here, so workers do not race on it while importing main
+    init_db()
+    close_connections()
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="uvloop" if _installed("uvloop") else "auto",
+        http="httptools" if _installed("httptools") else "auto",
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        reload=args.reload,
+        log_level=args.log_level,
+        proxy_headers=True,
+        **options,
+    )
+
+
+if __name__ == "__main__":
+    main()
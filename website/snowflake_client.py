@@ -8,6 +8,7 @@ from typing import Any, Dict, List, Optional
 
 import httpx
 from snowflake_jwt import generate_snowflake_jwt
+from timing import span
 
 
 def execute_snowflake_sql(
@@ -40,13 +41,14 @@ def execute_snowflake_sql(
     Returns:
         API response JSON
     """
-    token = generate_snowflake_jwt(
-        account_identifier=account_identifier,
-        user=user,
-        private_key_path=private_key_path,
-        private_key_pem=private_key_pem,
-        passphrase=passphrase,
-    )
+    with span("snowflake.jwt"):
+        token = generate_snowflake_jwt(
+            account_identifier=account_identifier,
+            user=user,
+            private_key_path=private_key_path,
+            private_key_pem=private_key_pem,
+            passphrase=passphrase,
+        )
 
     # Build account URL (account_identifier can be org-account or locator.region.cloud)
     account_clear = account_identifier.replace("_", "-").lower()
@@ -74,7 +76,8 @@ def execute_snowflake_sql(
     if role:
         body["role"] = role
 
-    with httpx.post(url, headers=headers, json=body, timeout=timeout + 30) as resp:
+    with span("snowflake.sql"):
+        resp = httpx.post(url, headers=headers, json=body, timeout=timeout + 30)
         resp.raise_for_status()
         return resp.json()
 
@@ -175,9 +175,11 @@ function renderBookmark(b, isFeed = false) {
   card.className = 'bookmark-card';
   card.dataset.id = b.id;
 
-  const thumb = b.image_base64
-    ? `<img class="bookmark-thumb" src="data:image/png;base64,${b.image_base64}" alt="">`
-    : '<div class="bookmark-thumb-placeholder">🛒</div>';
+  const thumb = b.thumbnail_url
+    ? `<img class="bookmark-thumb" src="${API_BASE}${escapeHtml(b.thumbnail_url)}" alt="" loading="lazy">`
+    : b.image_base64
+      ? `<img class="bookmark-thumb" src="data:image/png;base64,${b.image_base64}" alt="">`
+      : '<div class="bookmark-thumb-placeholder">🛒</div>';
 
   const count = Array.isArray(b.results) ? b.results.length : 0;
   const defaultBoardId = state.boards[0]?.id || '';
@@ -215,7 +217,8 @@ function renderBookmark(b, isFeed = false) {
   }
   card.addEventListener('click', (e) => {
     if (isFeed || !e.target.closest('.bookmark-delete, .bookmark-board-select')) {
-      openDetail(b, isFeed);
+      // list entries carry only a thumbnail; the detail view fetches the full bookmark
+      openDetail(isFeed ? b : b.id, isFeed);
     }
   });
   return card;
@@ -0,0 +1,123 @@
+"""
+Bookmark thumbnails, rendered off the request path.
+
+create_bookmark stores the original; the endpoint then submits a job to this module's thread
+pool that renders every THUMBNAIL_SIZES variant (longest side, no upscaling, metadata dropped)
+and stores them next to the image. Without Pillow nothing is rendered and thumbnail requests
+are answered with the original.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from config import THUMBNAIL_FORMAT, THUMBNAIL_QUALITY, THUMBNAIL_SIZES, THUMBNAIL_WORKERS
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=max(1, THUMBNAIL_WORKERS), thread_name_prefix="thumbnails")
+
+_stats = {"submitted": 0, "coalesced": 0, "rendered": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0}
+# key -> job not finished yet; a miss on a cold image must not queue another render of it
+_pending: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def available() -> bool:
+    return Image is not None and bool(THUMBNAIL_SIZES)
+
+
+def pick_size(requested: Optional[int]) -> int:
+    """Smallest configured size covering the request (the largest if none does)."""
+    if requested is None:
+        return THUMBNAIL_SIZES[0]
+    return next((s for s in THUMBNAIL_SIZES if s >= requested), THUMBNAIL_SIZES[-1])
+
+
+def _encode(img) -> Tuple[bytes, str]:
+    fmt = "WEBP" if THUMBNAIL_FORMAT == "WEBP" else "JPEG"
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        rgba = img.convert("RGBA")
+        bg = Image.new("RGB", rgba.size, (255, 255, 255))
+        bg.paste(rgba, mask=rgba.getchannel("A"))
+        img = bg
+    elif img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        img.save(out, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+    else:
+        img.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue(), f"image/{fmt.lower()}"
+
+
+def render(raw: bytes) -> Dict[int, Tuple[bytes, str]]:
+    """Blocking: {size: (bytes, mime)} for every configured size; {} if raw is not a decodable image."""
+    if not available():
+        return {}
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            img.load()
+            img = ImageOps.exif_transpose(img)
+            out = {}
+            for size in sorted(THUMBNAIL_SIZES, reverse=True):
+                # each smaller size is downscaled from the previous one, not from the original
+                img.thumbnail((size, size), Image.LANCZOS)
+                out[size] = _encode(img)
+    except Exception as e:
+        _stats["failed"] += 1
+        logger.info("thumbnail render skipped (%s: %s)", type(e).__name__, e)
+        return {}
+    _stats["rendered"] += 1
+    _stats["bytes_in"] += len(raw)
+    _stats["bytes_out"] += sum(len(data) for data, _ in out.values())
+    return out
+
+
+def _log_failure(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("thumbnail job failed: %r", future.exception())
+
+
+def submit(fn: Callable, *args, key: Optional[str] = None) -> Optional[Future]:
+    """
+    Run fn(*args) on the thumbnail pool; None when thumbnails are disabled or unavailable.
+    While a job submitted with the same key is queued or running, that job is returned instead.
+    """
+    if not available():
+        return None
+    with _pending_lock:
+        if key is not None and key in _pending:
+            _stats["coalesced"] += 1
+            return _pending[key]
+        try:
+            future = _executor.submit(fn, *args)
+        except RuntimeError:  # pool already shut down; requests fall back to the original
+            return None
+        _stats["submitted"] += 1
+        if key is not None:
+            _pending[key] = future
+    future.add_done_callback(_log_failure)
+    if key is not None:
+        future.add_done_callback(lambda f: _release(key, f))
+    return future
+
+
+def _release(key: str, future: Future) -> None:
+    with _pending_lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def stats() -> dict:
+    return {"available": available(), "sizes": list(THUMBNAIL_SIZES), "pending": len(_pending), **_stats}
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=True)
@@ -0,0 +1,160 @@
+"""
+Per-request timing spans.
+
+    with timing.span("vision"):
+        ...
+
+Spans recorded while a request is handled are reported in its `Server-Timing` header
+(durations of the same name are summed; `total` is the time to the response headers).
+Every span and every request is also observed into in-process histograms, rendered in
+Prometheus text format by render_prometheus() for GET /metrics. Histograms are per worker.
+"""
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+# seconds; upper bounds of the histogram buckets (+Inf is implicit)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_spans: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar("timing_spans", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_span_hist: dict[str, Histogram] = {}
+_request_hist: dict[tuple[str, str, str], Histogram] = {}
+
+
+def record(name: str, seconds: float) -> None:
+    hist = _span_hist.get(name)
+    if hist is None:
+        hist = _span_hist[name] = Histogram()
+    hist.observe(seconds)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of span() for sync and async functions."""
+
+    def wrap(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return wrap
+
+
+def server_timing(spans: list[tuple[str, float]], total: float) -> str:
+    totals: dict[str, float] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    totals["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware: collects the request's spans, adds Server-Timing to the response head and
+    observes the request into lens_http_request_seconds{method,route,status}. Spans recorded
+    after the head is sent (e.g. while an SSE body streams) reach the histograms only.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        spans: list[tuple[str, float]] = []
+        token = _spans.set(spans)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(spans, time.perf_counter() - started).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
+            # the matched route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            key = (scope["method"], route, str(status))
+            hist = _request_hist.get(key)
+            if hist is None:
+                hist = _request_hist[key] = Histogram()
+            hist.observe(time.perf_counter() - started)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render(lines: list[str], metric: str, labels: str, hist: Histogram) -> None:
+    cumulative = 0
+    for bound, count in zip(BUCKETS, hist.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    lines.append(f"{metric}_sum{{{labels}}} {hist.sum:.6f}")
+    lines.append(f"{metric}_count{{{labels}}} {hist.count}")
+
+
+def render_prometheus() -> str:
+    """Histograms in Prometheus text exposition format (version 0.0.4)."""
+    lines = [
+        "# HELP lens_span_seconds Duration of instrumented request stages.",
+        "# TYPE lens_span_seconds histogram",
+    ]
+    for name, hist in sorted(_span_hist.items()):
+        _render(lines, "lens_span_seconds", f'span="{_escape(name)}"', hist)
+    lines += [
+        "# HELP lens_http_request_seconds Time from request start until the response completed.",
+        "# TYPE lens_http_request_seconds histogram",
+    ]
+    for (method, route, status), hist in sorted(_request_hist.items()):
+        labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+        _render(lines, "lens_http_request_seconds", labels, hist)
+    return "\n".join(lines) + "\n"